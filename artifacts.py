@@ -0,0 +1,85 @@
+# artifacts.py - compact intermediate outputs of the staged CLI (fetch -> classify -> merge -> render)
+import os
+import json
+import time
+import hashlib
+from feeds import CACHE_DIR
+
+# --- Configuration ---
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "stages")
+ARTICLES_FILE = os.path.join(ARTIFACT_DIR, "articles.jsonl")     # fetch: one article per line
+VOTES_FILE = os.path.join(ARTIFACT_DIR, "votes.json")            # classify: the vote matrix
+SELECTION_FILE = os.path.join(ARTIFACT_DIR, "selection.jsonl")   # merge: articles that passed consensus
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def write_jsonl(path, rows):
+    _atomic_write(path, "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows))
+
+def read_jsonl(path):
+    """Rows of a JSONL artifact, or None when it does not exist yet"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+
+def describe(path):
+    """'<path> (<age>)' for log lines"""
+    age = time.time() - os.path.getmtime(path)
+    return f"{path} ({age / 3600:.1f}h old)" if age >= 3600 else f"{path} ({age / 60:.0f}m old)"
+
+def articles_digest(articles):
+    """Vote matrices index articles by id, so they are only valid for the exact article list"""
+    h = hashlib.sha1()
+    for a in articles:
+        h.update(f"{a['id']}\x00{a['link']}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def save_articles(articles):
+    write_jsonl(ARTICLES_FILE, articles)
+
+def load_articles():
+    return read_jsonl(ARTICLES_FILE)
+
+def save_vote_matrix(votes, articles, models, min_votes, early_exit=True):
+    """votes: {article id: {model name: True/False/None}}; None is a failed call"""
+    matrix = {
+        "articles": articles_digest(articles),
+        "models": [m['name'] for m in models],
+        "min_votes": min_votes,
+        "early_exit": early_exit,
+        "created": time.time(),
+        "votes": {str(aid): article_votes for aid, article_votes in sorted(votes.items())},
+    }
+    _atomic_write(VOTES_FILE, json.dumps(matrix, ensure_ascii=False, separators=(",", ":")))
+
+def load_vote_matrix(articles, min_votes=None):
+    """The saved vote matrix for these articles; None when missing, made from another
+    fetch, or collected with early exit for a consensus threshold other than `min_votes`"""
+    try:
+        with open(VOTES_FILE, "r", encoding="utf-8") as f:
+            matrix = json.load(f)
+    except FileNotFoundError:
+        return None
+    if matrix.get("articles") != articles_digest(articles):
+        print(f"::warning::{VOTES_FILE} was classified from a different fetch; ignoring it", flush=True)
+        return None
+    if min_votes and matrix.get("early_exit", True) and min_votes != matrix.get("min_votes", min_votes):
+        # Early-exit voting stops asking once an article is decided for the old threshold, in
+        # either direction, so its votes are incomplete for any other threshold
+        print(f"::warning::{VOTES_FILE} was classified with early exit for {matrix['min_votes']}+ votes "
+              f"and cannot be merged at {min_votes}+; ignoring it", flush=True)
+        return None
+    return {int(aid): article_votes for aid, article_votes in matrix["votes"].items()}
+
+def save_selection(articles):
+    write_jsonl(SELECTION_FILE, articles)
+
+def load_selection():
+    return read_jsonl(SELECTION_FILE)
@@ -0,0 +1,151 @@
+# backoff.py - header-driven retry and pacing for provider calls
+import re
+import time
+import random
+import threading
+
+# --- Configuration ---
+MAX_RETRY_WAIT = 120      # A reset further out than this means the quota is gone for the run
+FALLBACK_BASE_WAIT = 2    # Exponential fallback when a provider sends no hints
+FALLBACK_MAX_WAIT = 60
+PACE_THRESHOLD = 0.1      # Start spreading calls out below 10% remaining quota
+
+_lock = threading.Lock()
+_local = threading.local()
+RATE_LIMITS = {}
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_duration(value):
+    """Seconds from '7.66s', '2m59.56s', '120ms', '30' or an epoch timestamp"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = DURATION_RE.findall(value)
+        if not parts:
+            return None
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[unit] for n, unit in parts)
+    now = time.time()
+    if number > 1e12:   # epoch milliseconds (OpenRouter)
+        return max(0.0, number / 1000 - now)
+    if number > 1e9:    # epoch seconds
+        return max(0.0, number - now)
+    return number
+
+def _int_header(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+            except ValueError:
+                pass
+    return None
+
+def read_rate_limits(response):
+    """Normalize Groq/OpenRouter/Gemini rate limit hints from one response"""
+    headers = response.headers
+    limits = {
+        "retry_after": parse_duration(headers.get("retry-after")),
+        "limit_requests": _int_header(headers, "x-ratelimit-limit-requests", "x-ratelimit-limit"),
+        "remaining_requests": _int_header(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining"),
+        "reset_requests": parse_duration(headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset")),
+        "limit_tokens": _int_header(headers, "x-ratelimit-limit-tokens"),
+        "remaining_tokens": _int_header(headers, "x-ratelimit-remaining-tokens"),
+        "reset_tokens": parse_duration(headers.get("x-ratelimit-reset-tokens")),
+    }
+    # Gemini puts the delay in the error body as google.rpc.RetryInfo
+    if response.status_code == 429 and limits["retry_after"] is None:
+        try:
+            for detail in response.json().get("error", {}).get("details", []):
+                if "retryDelay" in detail:
+                    limits["retry_after"] = parse_duration(detail["retryDelay"])
+        except (ValueError, AttributeError):
+            pass
+    return limits
+
+def pace_delay(limits):
+    """Spread the remaining quota over the time left until it resets"""
+    delay = 0.0
+    for kind in ("requests", "tokens"):
+        remaining = limits.get(f"remaining_{kind}")
+        limit = limits.get(f"limit_{kind}")
+        reset = limits.get(f"reset_{kind}")
+        if remaining is None or reset is None:
+            continue
+        if remaining <= 0:
+            delay = max(delay, reset)
+        elif limit and remaining / limit < PACE_THRESHOLD:
+            delay = max(delay, reset / (remaining + 1))
+    return min(delay, MAX_RETRY_WAIT)
+
+def _state(model_name):
+    return RATE_LIMITS.setdefault(model_name, {
+        "responses": 0, "retries_429": 0, "retries_5xx": 0,
+        "sleep_seconds": 0.0, "next_allowed": 0.0, "last": {}
+    })
+
+def observe(model_name, response):
+    """Record the hints from a response and schedule any proactive slowdown"""
+    limits = read_rate_limits(response)
+    with _lock:
+        state = _state(model_name)
+        state["responses"] += 1
+        if response.status_code == 429:
+            state["retries_429"] += 1
+        elif response.status_code >= 500:
+            state["retries_5xx"] += 1
+        state["last"] = {k: v for k, v in limits.items() if v is not None}
+        delay = pace_delay(limits)
+        if delay > 0:
+            state["next_allowed"] = max(state["next_allowed"], time.monotonic() + delay)
+    return limits
+
+def retry_delay(response, attempt):
+    """How long to wait before retrying: provider hint first, jittered exponential otherwise"""
+    if response is not None:
+        limits = read_rate_limits(response)
+        hinted = limits["retry_after"]
+        if hinted is None and response.status_code == 429:
+            resets = [limits[k] for k in ("reset_requests", "reset_tokens") if limits[k] is not None]
+            hinted = max(resets) if resets else None
+        if hinted is not None:
+            return hinted + random.uniform(0, min(1.0, 0.1 * hinted + 0.25))
+    base = min(FALLBACK_MAX_WAIT, FALLBACK_BASE_WAIT * (2 ** attempt))
+    return random.uniform(base / 2, base)
+
+def set_stop_event(event):
+    """Cut backoff sleeps in this thread short once `event` is set (dispatch workers)"""
+    _local.stop = event
+
+def stop_requested():
+    """True once this thread's dispatcher has stopped; retry loops give up instead of retrying"""
+    stop = getattr(_local, "stop", None)
+    return stop is not None and stop.is_set()
+
+def backoff_sleep(model_name, seconds):
+    stop = getattr(_local, "stop", None)
+    started = time.monotonic()
+    if stop is None:
+        time.sleep(seconds)
+    else:
+        stop.wait(seconds)
+    with _lock:
+        _state(model_name)["sleep_seconds"] += time.monotonic() - started
+
+def wait_for_quota(model_name):
+    """Block until any proactive slowdown scheduled by observe() has passed"""
+    with _lock:
+        delay = _state(model_name)["next_allowed"] - time.monotonic()
+    if delay > 0:
+        backoff_sleep(model_name, delay)
+    return max(0.0, delay)
+
+def rate_limit_report():
+    with _lock:
+        return {name: {k: (dict(v) if isinstance(v, dict) else v) for k, v in state.items() if k != "next_allowed"}
+                for name, state in RATE_LIMITS.items()}
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# bench.py - offline replay benchmark: recorded feed snapshots + a local OpenAI/Gemini-compatible mock
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import argparse
+import tempfile
+import importlib
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Configuration ---
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(REPO_DIR, "bench", "feeds")
+BASELINE_FILE = os.path.join(REPO_DIR, "bench", "baseline.json")
+API_KEY_ENVS = ["GEM", "OP", "FRY", "GEM2", "LAM"]
+
+SHARED_SELECT_PCT = 30   # Share of titles every mock model picks; keeps consensus realistic
+MODEL_SELECT_PCT = 10    # Extra per-model picks, so models disagree a little
+
+PUB_DATE_RE = re.compile(rb"<pubDate>([^<]*)</pubDate>")
+ID_LINE_RE = re.compile(r"^(\d+):\s*(.*)$", re.M)
+
+def refresh_dates(data, newest_age=timedelta(hours=1)):
+    """Shift every pubDate so the newest lands `newest_age` ago, keeping their spacing"""
+    dates = []
+    for m in PUB_DATE_RE.finditer(data):
+        try:
+            dates.append(parsedate_to_datetime(m.group(1).decode()))
+        except (TypeError, ValueError):
+            pass
+    if not dates:
+        return data
+    shift = datetime.now(timezone.utc) - newest_age - max(d.astimezone(timezone.utc) for d in dates)
+    def replace(m):
+        try:
+            dt = parsedate_to_datetime(m.group(1).decode()) + shift
+        except (TypeError, ValueError):
+            return m.group(0)
+        return b"<pubDate>" + format_datetime(dt).encode() + b"</pubDate>"
+    return PUB_DATE_RE.sub(replace, data)
+
+class MockState:
+    """Options, counters and deterministic fault injection shared by the mock handlers"""
+    def __init__(self, options, feeds):
+        self.options = options
+        self.feeds = feeds
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.stats = {"requests": 0, "by_status": {}, "injected": {"429": 0, "5xx": 0, "malformed": 0, "think": 0}}
+
+    def rolls(self, body):
+        """Uniform [0, 1) draws for this request; a retry of the same body gets fresh ones"""
+        key = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            attempt = self.attempts[key] = self.attempts.get(key, 0) + 1
+        seed = f"{self.options.seed}:{key}:{attempt}"
+        # Not crc32: it is affine, so draws for kinds of the same length were correlated
+        return lambda kind: int(hashlib.sha1(f"{seed}:{kind}".encode()).hexdigest()[:8], 16) / 2 ** 32
+
+    def count(self, status, injected=None):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_status"][str(status)] = self.stats["by_status"].get(str(status), 0) + 1
+            if injected:
+                self.stats["injected"][injected] += 1
+
+def mock_selection(model, text):
+    picked = []
+    for aid, title in ID_LINE_RE.findall(text):
+        if zlib.crc32(title.encode()) % 100 < SHARED_SELECT_PCT or zlib.crc32(f"{model}\x00{title}".encode()) % 100 < MODEL_SELECT_PCT:
+            picked.append(int(aid))
+    return picked
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, data, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        name = self.path.rsplit("/", 1)[-1]
+        data = self.server.state.feeds.get(name)
+        if data is None:
+            self._send(404, b"not found", "text/plain")
+        else:
+            self._send(200, data, "application/rss+xml")
+
+    def do_POST(self):
+        state = self.server.state
+        opts = state.options
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        roll = state.rolls(body)
+        time.sleep(max(0.0, opts.latency + opts.jitter * (2 * roll("latency") - 1)))
+
+        gemini = ":generateContent" in self.path
+        request = json.loads(body)
+        if gemini:
+            model = self.path.split("/models/", 1)[-1].split(":", 1)[0]
+            text = "\n".join(p.get("text", "") for p in request["contents"][0]["parts"])
+        else:
+            model = request.get("model", "")
+            text = request["messages"][-1]["content"]
+
+        if roll("429") < opts.rate_429:
+            state.count(429, "429")
+            if gemini:
+                error = {"error": {"code": 429, "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                                             "retryDelay": f"{opts.retry_after}s"}]}}
+                return self._send(429, json.dumps(error).encode())
+            return self._send(429, b'{"error": {"message": "rate limited"}}',
+                              headers=[("retry-after", str(opts.retry_after))])
+        if roll("5xx") < opts.rate_5xx:
+            state.count(503, "5xx")
+            return self._send(503, b'{"error": {"message": "overloaded"}}')
+
+        content = json.dumps(mock_selection(model, text))
+        injected = None
+        if roll("malformed") < opts.malformed:
+            content = "Selected ids: " + content.strip("[]")
+            injected = "malformed"
+        elif roll("think") < opts.think:
+            content = "<think>Weighing each headline against the criteria before answering.</think>\n" + content
+            injected = "think"
+        prompt_tokens = len(text) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        reasoning_tokens = 40 if injected == "think" else 0
+        if gemini:
+            reply = {"candidates": [{"content": {"parts": [{"text": content}]}}],
+                     "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                       "thoughtsTokenCount": reasoning_tokens}}
+        else:
+            reply = {"choices": [{"message": {"content": content}}],
+                     "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens + reasoning_tokens,
+                               "completion_tokens_details": {"reasoning_tokens": reasoning_tokens}}}
+        state.count(200, injected)
+        self._send(200, json.dumps(reply).encode())
+
+def start_mock(options, feeds):
+    server = ThreadingHTTPServer(("127.0.0.1", options.port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(options, feeds)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def load_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    feeds = {}
+    for name in sorted(os.listdir(snapshot_dir)):
+        if name.endswith(".xml"):
+            with open(os.path.join(snapshot_dir, name), "rb") as f:
+                feeds[name] = refresh_dates(f.read())
+    return feeds
+
+def snapshot_name(url):
+    """bdit-daily_feed.xml for .../bdit/daily_feed.xml; the feeds share file names"""
+    return "-".join(url.split("/")[-2:])
+
+def record_snapshots(script):
+    """Fetch the script's live URLS once and make them the replay set. The old set
+    is only replaced when every feed came back, so a replay never mixes the two."""
+    sys.path.insert(0, REPO_DIR)
+    mod = importlib.import_module(script)
+    from feeds import fetch_feeds
+    paths = fetch_feeds(mod.URLS)
+    missing = [url for url, path in zip(mod.URLS, paths) if not path]
+    if missing:
+        print(f"::error::Could not fetch {', '.join(missing)}; {SNAPSHOT_DIR} left unchanged", flush=True)
+        return 1
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.endswith(".xml"):
+            os.remove(os.path.join(SNAPSHOT_DIR, name))
+    for url, path in zip(mod.URLS, paths):
+        shutil.copyfile(path, os.path.join(SNAPSHOT_DIR, snapshot_name(url)))
+        print(f"Recorded {url} -> {snapshot_name(url)}", flush=True)
+    print("Outputs will change; re-save the baseline with --save-baseline", flush=True)
+    return 0
+
+def feed_outputs(workdir):
+    from rss import load_items
+    from router import FEED_ROUTES
+    outputs = {}
+    for route in FEED_ROUTES:
+        path = os.path.join(workdir, route["file"])
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            outputs[route["file"]] = {"sha256": digest, "links": sorted(el.findtext("link") for el in load_items(path))}
+    return outputs
+
+def run_benchmark(options):
+    feeds = load_snapshots(options.snapshots)
+    server = start_mock(options, feeds)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix="curator-bench-")
+    os.environ["CURATOR_CACHE_DIR"] = os.path.join(workdir, ".cache")
+    for env in API_KEY_ENVS:
+        os.environ.setdefault(env, "bench")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    mod = importlib.import_module(options.script)
+    from backoff import rate_limit_report
+    from metrics import write_run_report, run_report
+    from profiling import enable_profiling, write_profile_report
+    if options.profile:
+        enable_profiling()
+
+    recorded = sorted(snapshot_name(url) for url in mod.URLS)
+    if sorted(feeds) != recorded:
+        print(f"::warning::{options.snapshots} holds {', '.join(sorted(feeds))}, not recordings of "
+              f"{options.script}.URLS ({', '.join(recorded)}); refresh them with --record", flush=True)
+    mod.URLS = [f"{base}/feeds/{name}" for name in feeds]
+    for name in dir(mod):
+        if name.endswith("_API_URL"):
+            setattr(mod, name, f"{base}/v1beta/models" if name == "GOOGLE_API_URL" else f"{base}/v1/chat/completions")
+    if options.unthrottled:
+        for m in getattr(mod, "MODELS", []) + [getattr(mod, "SCREENER", {})]:
+            m["rpm"], m["tpm"] = 10 ** 6, 10 ** 9
+
+    started = time.monotonic()
+    try:
+        mod.main()
+    except SystemExit as e:
+        print(f"::warning::{options.script}.main() exited with {e.code}", flush=True)
+    wall = time.monotonic() - started
+    write_run_report()
+    write_profile_report()
+    server.shutdown()
+
+    models = run_report()["models"]
+    report = {
+        "script": options.script,
+        "options": {k: v for k, v in vars(options).items() if k not in ("baseline", "save_baseline", "snapshots")},
+        "wall_seconds": round(wall, 3),
+        "mock_requests": server.state.stats["requests"],
+        "mock_by_status": server.state.stats["by_status"],
+        "injected": server.state.stats["injected"],
+        "metrics_429": sum(m["http_429"] for m in models),
+        "metrics_5xx": sum(m["http_5xx"] for m in models),
+        "batches": sum(m["batches"] for m in models),
+        "backoff_sleep_seconds": round(sum(r["sleep_seconds"] for r in rate_limit_report().values()), 3),
+        "limiter_wait_seconds": round(sum(m["limiter_wait_seconds"] for m in models), 3),
+        "outputs": feed_outputs(workdir),
+    }
+    if not options.keep:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        print(f"Outputs kept in {workdir}", flush=True)
+    return report
+
+def check_counts(report):
+    """The run's metrics must see every fault the mock injected; a mismatch means
+    some responses never reached call_model's status handling. A fault kind that
+    was asked for but never injected means the run tested nothing about it."""
+    ok = True
+    for kind, rate in (("429", "rate_429"), ("5xx", "rate_5xx"), ("malformed", "malformed")):
+        if report["options"][rate] > 0 and not report["injected"][kind]:
+            ok = False
+            print(f"::error::--{rate.replace('_', '-')} {report['options'][rate]} injected no {kind} faults in "
+                  f"{report['mock_requests']} requests; raise the rate or pick another --seed", flush=True)
+    for kind, key in (("429", "metrics_429"), ("5xx", "metrics_5xx")):
+        if report["injected"][kind] != report[key]:
+            ok = False
+            print(f"::error::Mock served {report['injected'][kind]}x {kind} but the run metrics recorded {report[key]}", flush=True)
+    return ok
+
+def compare(report, baseline):
+    print("\nBenchmark vs. baseline:", flush=True)
+    for key in ("wall_seconds", "mock_requests", "batches", "backoff_sleep_seconds", "limiter_wait_seconds"):
+        old, new = baseline.get(key), report.get(key)
+        if isinstance(old, (int, float)) and old:
+            print(f"   {key}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)", flush=True)
+        else:
+            print(f"   {key}: {old} -> {new}", flush=True)
+    same = True
+    for name in sorted(set(report["outputs"]) | set(baseline.get("outputs", {}))):
+        old = set(baseline.get("outputs", {}).get(name, {}).get("links", []))
+        new = set(report["outputs"].get(name, {}).get("links", []))
+        if old != new:
+            same = False
+            print(f"   {name}: {len(new - old)} items added, {len(old - new)} removed", flush=True)
+    print(f"   Output items {'identical to' if same else 'differ from'} baseline", flush=True)
+    return same
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded feeds against a local mock LLM server and time the run.")
+    parser.add_argument("--script", default="main", help="main, m or bmain")
+    parser.add_argument("--port", type=int, default=0, help="mock server port (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds per mock completion")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-429", type=float, default=0.3)
+    parser.add_argument("--rate-5xx", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=float, default=0.2, help="seconds the mock asks for on 429")
+    parser.add_argument("--malformed", type=float, default=0.2, help="share of replies without a JSON array")
+    parser.add_argument("--think", type=float, default=0.1, help="share of replies with a <think> preamble")
+    parser.add_argument("--seed", type=int, default=2, help="with the default rates, injects every fault kind into main's replay")
+    parser.add_argument("--unthrottled", action="store_true", help="lift MODELS rpm/tpm so only the mock sets the pace")
+    parser.add_argument("--snapshots", default=SNAPSHOT_DIR)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--no-baseline", action="store_true", help="skip the comparison (e.g. for another script)")
+    parser.add_argument("--profile", action="store_true", help="per-stage cProfile/tracemalloc report (see profiling.py)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary output directory")
+    parser.add_argument("--record", action="store_true", help="fetch the script's live URLS into the snapshot dir and exit")
+    parser.add_argument("--report", help="also write the benchmark report to this JSON file")
+    options = parser.parse_args()
+
+    if options.record:
+        return record_snapshots(options.script)
+
+    report = run_benchmark(options)
+    print(f"\nBenchmark [{options.script}]: {report['wall_seconds']:.1f}s wall, {report['mock_requests']} requests "
+          f"{report['mock_by_status']}, {report['batches']} batches, slept {report['backoff_sleep_seconds']:.1f}s "
+          f"(+{report['limiter_wait_seconds']:.1f}s limiter); injected {report['injected']}", flush=True)
+    if options.report:
+        with open(options.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    ok = check_counts(report)
+    if options.save_baseline:
+        with open(options.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Baseline saved to {options.baseline}", flush=True)
+    elif not options.no_baseline:
+        if not os.path.exists(options.baseline):
+            print(f"::error::No baseline at {options.baseline}; use --save-baseline or --no-baseline", flush=True)
+            return 1
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            ok = compare(report, json.load(f)) and ok
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
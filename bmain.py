@@ -3,28 +3,48 @@
 import os
 import json
 import requests
-import time
 import sys
+import signal
 import re
-from xml.etree import ElementTree as ET
 from datetime import datetime, timedelta, timezone
-from email.utils import parsedate_to_datetime
+from feeds import fetch_feeds, iter_articles
+from rss import write_feeds
+from router import FeedRouter
+from clients import get_client, print_connection_report
+from voting import collect_votes, tally
+from cluster import cluster_articles, dedup_articles, fan_out_votes
+from threads import load_threads, save_threads, assign_thread
+from backoff import MAX_RETRY_WAIT, observe, retry_delay, backoff_sleep, wait_for_quota, stop_requested
+from metrics import record_response, record_error, write_run_report
+from budget import record_usage, print_usage_report, save_usage
+from profiling import stage, enable_profiling, write_profile_report
 
 # Configuration
 MAX_FEED_ITEMS = 100
+INCREMENTAL_FEEDS = True  # Merge into the published feeds as a rolling window of MAX_FEED_ITEMS
+PAGED_FEEDS = True        # Archive pages, JSON Feed and .gz copies (needs INCREMENTAL_FEEDS)
+
+# Consensus: an article needs CONSENSUS_MIN_VOTES model votes. With early-exit voting
+# the models are asked in MODELS order, VOTING_WAVE_SIZE at a time, and an article
+# leaves later waves as soon as its outcome is decided.
+CONSENSUS_MIN_VOTES = 2
+EARLY_EXIT_VOTING = True
+VOTING_WAVE_SIZE = 2
 URLS = [
     "https://evilgodfahim.github.io/bdit/daily_feed_2.xml",
     "https://evilgodfahim.github.io/bdit/daily_feed.xml",
     "https://evilgodfahim.github.io/edit/daily_feed.xml"
 ]
 
+# batch_size caps items per request; batches are packed up to each model's
+# context and tpm budget by dispatch.pack_batches
 MODELS = [
-    {"name": "kimi-k2-instruct-0905", "display": "Kimi-K2-Instruct", "batch_size": 50, "api": "fyra"},
-    {"name": "meta-llama/llama-3.3-70b-instruct", "display": "Llama-3.3-70B", "batch_size": 50, "api": "openrouter"},
-    {"name": "qwen/qwen3-32b", "display": "Qwen-3-32B", "batch_size": 25, "api": "groq"},
-    {"name": "openai/gpt-oss-120b", "display": "GPT-OSS-120B", "batch_size": 25, "api": "groq"},
-    {"name": "mistral-small-latest", "display": "Mistral-Small", "batch_size": 40, "api": "mistral"},
-    {"name": "gemini-2.5-flash-lite", "display": "Gemini-2.5-Flash-Lite", "batch_size": 100, "api": "google"}
+    {"name": "kimi-k2-instruct-0905", "display": "Kimi-K2-Instruct", "batch_size": 50, "api": "fyra", "rpm": 10, "tpm": 100000, "context": 262144},
+    {"name": "meta-llama/llama-3.3-70b-instruct", "display": "Llama-3.3-70B", "batch_size": 50, "api": "openrouter", "rpm": 20, "tpm": 100000, "context": 131072},
+    {"name": "qwen/qwen3-32b", "display": "Qwen-3-32B", "batch_size": 100, "api": "groq", "rpm": 60, "tpm": 6000, "context": 131072},
+    {"name": "openai/gpt-oss-120b", "display": "GPT-OSS-120B", "batch_size": 100, "api": "groq", "rpm": 30, "tpm": 8000, "context": 131072},
+    {"name": "mistral-small-latest", "display": "Mistral-Small", "batch_size": 40, "api": "mistral", "rpm": 60, "tpm": 500000, "context": 131072},
+    {"name": "gemini-2.5-flash-lite", "display": "Gemini-2.5-Flash-Lite", "batch_size": 100, "api": "google", "rpm": 15, "tpm": 250000, "context": 1048576}
 ]
 
 # API Keys and URLs
@@ -45,51 +65,15 @@ Your task is to select headlines with structural and lasting significance.
 Return only a JSON array of selected IDs (e.g. [0,5,12])."""
 
 DEBUG = False
+CLUSTER_TIEBREAK = True  # Let Gemini settle near-threshold title pairs
 
-def is_bangla(text):
-    return any(0x0980 <= ord(c) <= 0x09FF for c in (text or ""))
-
-def save_xml(data, filename, error_message=None):
-    os.makedirs(os.path.dirname(filename) if os.path.dirname(filename) else ".", exist_ok=True)
-    rss = ET.Element("rss", version="2.0")
-    channel = ET.SubElement(rss, "channel")
-    feed_title = "Elite News Feed"
-    feed_title += " (English)" if "overflow" in filename else " (Bangla)"
-    ET.SubElement(channel, "title").text = feed_title
-    ET.SubElement(channel, "lastBuildDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    ET.SubElement(channel, "link").text = "https://github.com/evilgodfahim"
-    ET.SubElement(channel, "description").text = "AI-curated structural news feed"
-    if error_message:
-        item = ET.SubElement(channel, "item")
-        ET.SubElement(item, "title").text = "System Error"
-        ET.SubElement(item, "description").text = f"Script failed: {error_message}"
-        ET.SubElement(item, "pubDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    elif not data:
-        item = ET.SubElement(channel, "item")
-        ET.SubElement(item, "title").text = "End of Feed"
-        ET.SubElement(item, "description").text = "No additional articles in this feed."
-        ET.SubElement(item, "pubDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    else:
-        for art in data:
-            item = ET.SubElement(channel, "item")
-            ET.SubElement(item, "title").text = art['title']
-            ET.SubElement(item, "link").text = art['link']
-            ET.SubElement(item, "pubDate").text = art['pubDate']
-            models_str = ", ".join(art.get('selected_by', ['Unknown']))
-            category_info = art.get('category', 'News')
-            reason_info = art.get('reason', 'Selected')
-            html_desc = f"<p><b>[{category_info}]</b></p>"
-            html_desc += f"<p><i>{reason_info}</i></p>"
-            html_desc += f"<p><small>Selected by: {models_str}</small></p>"
-            html_desc += f"<hr/><p>{art['description']}</p>"
-            ET.SubElement(item, "description").text = html_desc
-    try:
-        tree = ET.ElementTree(rss)
-        ET.indent(tree, space="  ", level=0)
-        tree.write(filename, encoding="utf-8", xml_declaration=True)
-        print(f"   Saved {len(data) if data else 0} items to {filename}", flush=True)
-    except Exception as e:
-        print(f"::error::Failed to write XML {filename}: {e}", flush=True)
+def save_feeds(articles, error_message=None):
+    """Route every article to its feed (router.FEED_ROUTES) in one pass.
+    Returns the router, which counts articles per feed, and the items now in each feed."""
+    router = FeedRouter()
+    counts = write_feeds(articles, router, filenames=router.filenames, error_message=error_message,
+                         window=MAX_FEED_ITEMS if INCREMENTAL_FEEDS else None, paged=PAGED_FEEDS)
+    return router, counts
 
 def fetch_titles_only():
     all_articles = []
@@ -97,42 +81,12 @@ def fetch_titles_only():
     now = datetime.now(timezone.utc)
     cutoff_time = now - timedelta(hours=26)
     print(f"Time Filter: Articles after {cutoff_time.strftime('%Y-%m-%d %H:%M UTC')}", flush=True)
-    headers = {'User-Agent': 'BCS-Curator/3.0-Ensemble'}
-    for url in URLS:
+    for path in fetch_feeds(URLS):
+        if not path: continue
         try:
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.status_code != 200: continue
-            try:
-                root = ET.fromstring(r.content)
-            except: continue
-            for item in root.findall('.//item'):
-                pub_date = item.find('pubDate').text if item.find('pubDate') is not None else ""
-                if not pub_date: continue
-                try:
-                    dt = parsedate_to_datetime(pub_date)
-                    if dt.tzinfo is None: dt = dt.replace(tzinfo=timezone.utc)
-                    else: dt = dt.astimezone(timezone.utc)
-                    if dt < cutoff_time: continue
-                except: continue
-                link = item.find('link').text or ""
-                if not link:
-                    guid = item.find('guid')
-                    link = guid.text if guid is not None else ""
-                if not link or link in seen_links: continue
-                title = item.find('title').text or "No Title"
-                title = title.strip()
-                seen_links.add(link)
-                desc = item.find('description')
-                desc_text = desc.text if desc is not None else ""
-                all_articles.append({
-                    "id": len(all_articles),
-                    "title": title,
-                    "link": link,
-                    "description": desc_text or title,
-                    "pubDate": pub_date
-                })
-        except Exception:
-            continue
+            for art in iter_articles(path, cutoff_time, seen_links):
+                all_articles.append({"id": len(all_articles), **art})
+        except Exception: continue
     print(f"Loaded {len(all_articles)} unique headlines", flush=True)
     return all_articles
 
@@ -229,15 +183,21 @@ def call_model(model_info, batch):
         headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
         payload = {"model": model_info['name'], "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt_text}], "temperature": 0.3}
     max_retries = 5
-    base_wait = 30
+    m_name = model_info['name']
     for attempt in range(max_retries):
         try:
-            response = requests.post(api_url, headers=headers, json=payload, timeout=90)
+            wait_for_quota(m_name)
+            if stop_requested():
+                return None
+            response = get_client(api_type).post(api_url, headers=headers, json=payload, timeout=90)
+            observe(m_name, response)
+            record_response(api_type, m_name, response)
             if response.status_code == 200:
                 try:
                     response_data = response.json()
                 except Exception:
                     continue
+                record_usage(m_name, response_data, len(batch))
                 content = None
                 if isinstance(response_data, dict):
                     cand = response_data.get('candidates') or response_data.get('outputs') or []
@@ -259,83 +219,66 @@ def call_model(model_info, batch):
                 if parsed_data is not None and isinstance(parsed_data, list):
                     return parsed_data
                 else:
-                    time.sleep(2)
+                    record_error(api_type, m_name, "json_errors")
+                    backoff_sleep(m_name, retry_delay(None, 0))
             elif response.status_code == 429:
-                wait_time = base_wait * (2 ** attempt)
-                time.sleep(wait_time)
+                wait_time = retry_delay(response, attempt)
+                if wait_time > MAX_RETRY_WAIT:
+                    break
+                backoff_sleep(m_name, wait_time)
                 continue
             elif response.status_code >= 500:
-                time.sleep(10)
+                backoff_sleep(m_name, min(retry_delay(response, attempt), MAX_RETRY_WAIT))
                 continue
         except requests.exceptions.RequestException:
-            time.sleep(5)
-        time.sleep(2)
-    return []
+            record_error(api_type, m_name, "net_errors")
+            backoff_sleep(m_name, retry_delay(None, attempt))
+            continue
+        backoff_sleep(m_name, retry_delay(None, 0))
+    return None
 
-def call_gemini_cluster(all_articles, model_name="gemini-2.5-flash-lite", min_similarity=0.5):
-    if not GOOGLE_API_KEY:
-        print("::warning::Google API key missing; skipping clustering.", flush=True)
-        return None
+def call_gemini_tiebreak(pairs, by_id, model_name="gemini-2.5-flash-lite"):
+    """Ask Gemini which borderline title pairs report the same story"""
     lines = []
-    for a in all_articles:
-        title = (a['title'] or "").replace("\n", " ").strip()
-        desc = (a.get('description') or "").replace("\n", " ").strip()
-        lines.append(f"{a['id']}\t{title}\t{a.get('link','')}\t{desc}")
-    content_block = "\n".join(lines)
-    system = ("You are a strict clustering assistant. Input is a tab-separated list: id<TAB>title<TAB>link<TAB>description. "
-              f"Cluster headlines that are near-duplicates or strongly about the same event/impact. Only group items when similarity is approximately >= {int(min_similarity*100)}% (i.e. near-50% or greater). "
-              "Choose one main representative per cluster (prefer the clearest title). Output VALID JSON only: an array of objects with fields {\"cluster_id\":int, \"main\":id, \"members\":[ids...]}. No commentary, no markdown, no code fences.")
-    user = f"ARTICLES:\n{content_block}"
+    for i, (x, y) in enumerate(pairs):
+        title_a = (by_id[x]['title'] or "").replace("\n", " ").strip()
+        title_b = (by_id[y]['title'] or "").replace("\n", " ").strip()
+        lines.append(f"{i}\t{title_a}\t{title_b}")
+    system = ("You are a strict clustering assistant. Input is a tab-separated list: pair<TAB>title A<TAB>title B. "
+              "Decide for each pair whether the two headlines are near-duplicates or strongly about the same event/impact. "
+              "Output VALID JSON only: an array of the pair numbers that belong together, e.g. [0, 3]. No commentary, no markdown, no code fences.")
+    user = "PAIRS:\n" + "\n".join(lines)
     api_url = f"{GOOGLE_API_URL}/{model_name}:generateContent?key={GOOGLE_API_KEY}"
     headers = {"Content-Type": "application/json"}
     payload = {"contents": [{"parts": [{"text": system}, {"text": user}]}], "generationConfig": {"temperature": 0.0, "maxOutputTokens": 2000}}
     try:
-        resp = requests.post(api_url, headers=headers, json=payload, timeout=120)
+        resp = get_client("google").post(api_url, headers=headers, json=payload, timeout=120)
+        record_response("google", model_name, resp)
         if resp.status_code != 200:
-            return None
+            return set()
         data = resp.json()
-        text = None
-        if isinstance(data, dict):
-            cand = data.get('candidates') or data.get('outputs') or []
-            if cand:
-                try:
-                    text = cand[0]['content']['parts'][0]['text'].strip()
-                except Exception:
-                    pass
-        if text is None:
-            text = resp.text
-        if text.startswith("```"):
-            text = text.replace("```json", "").replace("```", "").strip()
+        record_usage(model_name, data, len(pairs))
+        text = data['candidates'][0]['content']['parts'][0]['text'].strip()
         parsed = extract_json_from_text(text)
-        
-        # Handle wrapped responses
-        if isinstance(parsed, dict):
-            # Try common wrapper keys
-            for key in ['clusters', 'data', 'result', 'output']:
-                if key in parsed and isinstance(parsed[key], list):
-                    parsed = parsed[key]
-                    break
-        
         if not isinstance(parsed, list):
             if DEBUG:
-                print("Gemini cluster returned invalid format (expected JSON list).", flush=True)
+                print("Gemini tie-break returned invalid format (expected JSON list).", flush=True)
                 print("Response text:", text[:2000], flush=True)
-                print("Parsed type:", type(parsed), flush=True)
-                print("Parsed value:", parsed, flush=True)
-            return None
-        validated = []
-        for i, c in enumerate(parsed):
-            if not isinstance(c, dict): continue
-            if 'members' not in c or 'main' not in c: continue
-            try:
-                members = [int(x) for x in c['members']]
-                main = int(c['main'])
-            except Exception:
-                continue
-            validated.append({"cluster_id": int(c.get("cluster_id", i)), "main": main, "members": members})
-        return validated
+            return set()
+        return {pairs[i] for i in parsed if isinstance(i, int) and 0 <= i < len(pairs)}
     except Exception:
-        return None
+        return set()
+
+def call_gemini_cluster(all_articles, model_name="gemini-2.5-flash-lite", min_similarity=0.5):
+    """Cluster near-duplicates locally (MinHash/LSH); Gemini only settles borderline pairs"""
+    by_id = {a['id']: a for a in all_articles}
+    tie_breaker = None
+    if CLUSTER_TIEBREAK and GOOGLE_API_KEY:
+        tie_breaker = lambda pairs: call_gemini_tiebreak(pairs, by_id, model_name)
+    clusters = cluster_articles(all_articles, min_similarity=min_similarity, tie_breaker=tie_breaker)
+    merged = sum(1 for c in clusters if len(c['members']) > 1)
+    print(f"Clustered {len(all_articles)} articles into {len(clusters)} items ({merged} multi-article clusters)", flush=True)
+    return clusters
 
 def main():
     print("=" * 60, flush=True)
@@ -360,91 +303,84 @@ def main():
     if needs_google and not GOOGLE_API_KEY:
         print("::error::LAM environment variable is missing!", flush=True)
         sys.exit(1)
-    articles = fetch_titles_only()
+    with stage("fetch"):
+        articles = fetch_titles_only()
     if not articles:
-        save_xml([], "filtered_feed.xml")
-        save_xml([], "filtered_feed_overflow.xml")
+        save_feeds([])
         return
-    model_batches = {}
-    for model_info in MODELS:
-        bs = model_info['batch_size']
-        model_batches[model_info['name']] = [articles[i:i + bs] for i in range(0, len(articles), bs)]
-    max_batch_count = max(len(b) for b in model_batches.values())
-    MAX_BATCHES_LIMIT = 20
-    selections_map = {}
-    for batch_idx in range(min(MAX_BATCHES_LIMIT, max_batch_count)):
-        for model_info in MODELS:
-            m_name = model_info['name']
-            if batch_idx >= len(model_batches[m_name]): continue
-            decisions = call_model(model_info, model_batches[m_name][batch_idx])
-            if decisions:
-                for aid in decisions:
-                    if 0 <= aid < len(articles):
-                        if aid not in selections_map:
-                            selections_map[aid] = {'models': [], 'count': 0}
-                        selections_map[aid]['models'].append(model_info['display'])
-                        selections_map[aid]['count'] += 1
-            time.sleep(8)
-        if batch_idx < min(MAX_BATCHES_LIMIT, max_batch_count) - 1:
-            time.sleep(20)
-    final_articles = []
-    for aid, info in selections_map.items():
-        if info['count'] >= 2:
-            art = articles[aid].copy()
-            art['selected_by'] = info['models']
-            art['category'] = 'BCS/Bank/GK'
-            art['reason'] = 'Selected by multi-model consensus'
-            final_articles.append(art)
+    with stage("classify"):
+        candidates, duplicate_groups = dedup_articles(articles)
+        MAX_BATCHES_LIMIT = 20
+        votes = collect_votes(candidates, MODELS, SYSTEM_PROMPT, call_model, CONSENSUS_MIN_VOTES,
+                              wave_size=VOTING_WAVE_SIZE if EARLY_EXIT_VOTING else None,
+                              max_batches=MAX_BATCHES_LIMIT)
+        fan_out_votes(votes, duplicate_groups)
+        selections_map = tally(votes, MODELS)
+    with stage("merge"):
+        final_articles = []
+        for aid, info in selections_map.items():
+            if info['count'] >= CONSENSUS_MIN_VOTES:
+                art = articles[aid].copy()
+                art['selected_by'] = info['models']
+                art['category'] = 'BCS/Bank/GK'
+                art['reason'] = 'Selected by multi-model consensus'
+                final_articles.append(art)
     if not final_articles:
-        save_xml([], "filtered_feed.xml")
-        save_xml([], "filtered_feed_overflow.xml")
+        save_feeds([])
         return
-    clusters = call_gemini_cluster(final_articles, model_name="gemini-2.5-flash-lite", min_similarity=0.5)
+    with stage("cluster"):
+        clusters = call_gemini_cluster(final_articles, model_name="gemini-2.5-flash-lite", min_similarity=0.5)
+    print_connection_report()
+    print_usage_report()
     if not clusters:
-        bangla_articles = [a for a in final_articles if is_bangla(a['title'])]
-        english_articles = [a for a in final_articles if not is_bangla(a['title'])]
-        save_xml(bangla_articles, "filtered_feed.xml")
-        save_xml(english_articles, "filtered_feed_overflow.xml")
+        save_feeds(final_articles)
         return
-    cluster_map = {}
-    used_ids = set()
-    for c in clusters:
-        cid = c['cluster_id']
-        members = c['members']
-        main = c['main'] if c['main'] in members else (members[0] if members else None)
-        if main is None: continue
-        cluster_map[cid] = {"main": main, "members": members}
-        used_ids.update(members)
-    next_cid = max(cluster_map.keys()) + 1 if cluster_map else 0
-    for art in final_articles:
-        if art['id'] not in used_ids:
-            cluster_map[next_cid] = {"main": art['id'], "members": [art['id']]}
-            next_cid += 1
-    clustered_items = []
-    for cid, info in cluster_map.items():
-        main_id = info['main']
-        members = info['members']
-        main_art = next((a for a in final_articles if a['id'] == main_id), None)
-        if not main_art: continue
-        similar_html = ""
-        sims = [m for m in members if m != main_id]
-        if sims:
-            similar_html += "<p><b>Similar items:</b></p><ul>"
-            for sid in sims:
-                art = next((a for a in final_articles if a['id'] == sid), None)
-                if art:
-                    safe_title = art['title']
-                    safe_link = art.get('link', '#')
-                    similar_html += f"<li><a href=\"{safe_link}\">{safe_title}</a></li>"
-            similar_html += "</ul>"
-        new_item = main_art.copy()
-        new_item['description'] = (new_item.get('description','') or '') + "<hr/>" + similar_html
-        new_item['cluster_id'] = cid
-        clustered_items.append(new_item)
-    bangla_articles = [a for a in clustered_items if is_bangla(a['title'])]
-    english_articles = [a for a in clustered_items if not is_bangla(a['title'])]
-    save_xml(bangla_articles, "filtered_feed.xml")
-    save_xml(english_articles, "filtered_feed_overflow.xml")
+    with stage("cluster"):
+        cluster_map = {}
+        used_ids = set()
+        for c in clusters:
+            cid = c['cluster_id']
+            members = c['members']
+            main = c['main'] if c['main'] in members else (members[0] if members else None)
+            if main is None: continue
+            cluster_map[cid] = {"main": main, "members": members}
+            used_ids.update(members)
+        next_cid = max(cluster_map.keys()) + 1 if cluster_map else 0
+        for art in final_articles:
+            if art['id'] not in used_ids:
+                cluster_map[next_cid] = {"main": art['id'], "members": [art['id']]}
+                next_cid += 1
+        by_id = {a['id']: a for a in final_articles}
+        thread_index = load_threads()
+        clustered_items = []
+        for cid, info in cluster_map.items():
+            main_id = info['main']
+            members = info['members']
+            main_art = by_id.get(main_id)
+            if not main_art: continue
+            sims = [m for m in members if m != main_id]
+            similar = [{"title": by_id[sid]['title'], "link": by_id[sid].get('link')} for sid in sims if sid in by_id]
+            thread_id, prior = assign_thread(thread_index, [main_art] + [by_id[m] for m in sims if m in by_id])
+            new_item = main_art.copy()
+            new_item['similar'] = similar
+            new_item['cluster_id'] = cid
+            new_item['thread_id'] = thread_id
+            new_item['prior_coverage'] = prior
+            clustered_items.append(new_item)
+        save_threads(thread_index)
+    continuing = sum(1 for a in clustered_items if a['prior_coverage'])
+    print(f"Story threads: {continuing}/{len(clustered_items)} items continue an earlier thread", flush=True)
+    with stage("render"):
+        save_feeds(clustered_items)
 
 if __name__ == "__main__":
-    main()
+    if "--profile" in sys.argv[1:]:
+        enable_profiling()
+    # A cancelled or timed-out Action sends SIGTERM; unwind so usage, metrics and stored votes are kept
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    try:
+        main()
+    finally:
+        save_usage()
+        write_run_report()
+        write_profile_report()
@@ -0,0 +1,177 @@
+# budget.py - token and cost accounting from provider usage blocks, with run and day budgets
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from feeds import CACHE_DIR
+
+# --- Configuration ---
+RUN_TOKEN_BUDGET = 1500000     # All models together, per run
+DAILY_TOKEN_BUDGET = 4000000   # All models together, per calendar day across runs
+# A MODELS entry may also set "tpd" (tokens/day) for its own free-tier quota.
+USAGE_FILE = os.path.join(CACHE_DIR, "usage.json")
+USAGE_KEEP_DAYS = 7
+
+# USD per 1M (input, output) tokens at list price; only used for the cost column.
+# Reasoning tokens bill as output.
+PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "openai/gpt-oss-120b": (0.15, 0.75),
+    "openai/gpt-oss-20b": (0.10, 0.50),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "meta-llama/llama-3.3-70b-instruct": (0.59, 0.79),
+    "qwen/qwen3-32b": (0.29, 0.59),
+    "kimi-k2-instruct-0905": (1.00, 3.00),
+    "mistral-small-latest": (0.10, 0.30),
+}
+
+_lock = threading.Lock()
+USAGE = {}      # model -> this run's totals
+DROPPED = {}    # model -> why the budget took it out of this run
+_daily = None
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+def _load_daily():
+    global _daily
+    if _daily is None:
+        try:
+            with open(USAGE_FILE, "r", encoding="utf-8") as f:
+                _daily = json.load(f)
+        except (OSError, ValueError):
+            _daily = {}
+    return _daily
+
+def parse_usage(data):
+    """(prompt, completion, reasoning) tokens from an OpenAI-style `usage` or Gemini
+    `usageMetadata` block, or None when the reply carries neither"""
+    if not isinstance(data, dict):
+        return None
+    usage = data.get("usage")
+    if isinstance(usage, dict):
+        details = usage.get("completion_tokens_details") or {}
+        reasoning = details.get("reasoning_tokens") or 0
+        completion = (usage.get("completion_tokens") or 0) - reasoning
+        return usage.get("prompt_tokens") or 0, max(0, completion), reasoning
+    meta = data.get("usageMetadata")
+    if isinstance(meta, dict):
+        return meta.get("promptTokenCount") or 0, meta.get("candidatesTokenCount") or 0, meta.get("thoughtsTokenCount") or 0
+    return None
+
+def _totals(table, model):
+    return table.setdefault(model, {"calls": 0, "articles": 0, "prompt": 0, "completion": 0, "reasoning": 0})
+
+def record_usage(model_name, data, articles=0):
+    """Account one successful reply; returns its total tokens (0 when unreported)"""
+    parsed = parse_usage(data)
+    if parsed is None:
+        return 0
+    prompt, completion, reasoning = parsed
+    with _lock:
+        for t in (_totals(USAGE, model_name), _totals(_load_daily().setdefault(_today(), {}), model_name)):
+            t["calls"] += 1
+            t["articles"] += articles
+            t["prompt"] += prompt
+            t["completion"] += completion
+            t["reasoning"] += reasoning
+    return prompt + completion + reasoning
+
+def _sum(t):
+    return t["prompt"] + t["completion"] + t["reasoning"]
+
+def run_tokens(model_name=None):
+    with _lock:
+        return sum(_sum(t) for m, t in USAGE.items() if model_name in (None, m))
+
+def day_tokens(model_name=None):
+    with _lock:
+        return sum(_sum(t) for m, t in _load_daily().get(_today(), {}).items() if model_name in (None, m))
+
+def cost(model_name, t):
+    price_in, price_out = PRICES.get(model_name, (0.0, 0.0))
+    return (t["prompt"] * price_in + (t["completion"] + t["reasoning"]) * price_out) / 1e6
+
+def tokens_per_article(model_info, estimate, batch):
+    """Observed tokens per article this run, or the dispatcher's estimate before any reply"""
+    with _lock:
+        t = USAGE.get(model_info['name'])
+        if t and t["articles"]:
+            return _sum(t) / t["articles"]
+    return estimate(model_info, batch) / max(1, len(batch))
+
+def _headroom(model_info):
+    """Tokens still allowed for this model: the tightest of run, day and its own tpd"""
+    limits = [RUN_TOKEN_BUDGET - run_tokens(), DAILY_TOKEN_BUDGET - day_tokens()]
+    if model_info.get("tpd"):
+        limits.append(model_info["tpd"] - day_tokens(model_info['name']))
+    return min(limits)
+
+def _drop(model_info, reason):
+    with _lock:
+        if model_info['name'] not in DROPPED:
+            DROPPED[model_info['name']] = reason
+            print(f"::warning::Token budget: dropping {model_info['display']} for the rest of the run ({reason})", flush=True)
+
+def plan_units(units, estimate):
+    """Trim a wave's (model_info, batch) units to the budgets by dropping whole models,
+    the most expensive per article first, rather than running into quota walls"""
+    units = [(m, b) for m, b in units if m['name'] not in DROPPED]
+    while units:
+        need, infos, sample = {}, {}, {}
+        for m, b in units:
+            need[m['name']] = need.get(m['name'], 0) + estimate(m, b)
+            infos[m['name']] = m
+            sample.setdefault(m['name'], b)
+        over_quota = [n for n in need if infos[n].get("tpd") and need[n] > infos[n]["tpd"] - day_tokens(n)]
+        if over_quota:
+            victim, reason = infos[over_quota[0]], "daily model quota"
+        elif sum(need.values()) > min(RUN_TOKEN_BUDGET - run_tokens(), DAILY_TOKEN_BUDGET - day_tokens()):
+            victim = infos[max(need, key=lambda n: tokens_per_article(infos[n], estimate, sample[n]))]
+            reason = "run/day token budget"
+        else:
+            break
+        _drop(victim, reason)
+        units = [(m, b) for m, b in units if m['name'] != victim['name']]
+    return units
+
+def admit(model_info, tokens):
+    """Last check right before a call, in case replies cost more than estimated"""
+    if model_info['name'] in DROPPED:
+        return False
+    if tokens > _headroom(model_info):
+        _drop(model_info, "budget spent mid-wave")
+        return False
+    return True
+
+def save_usage():
+    with _lock:
+        daily = _load_daily()
+        cutoff = (datetime.now() - timedelta(days=USAGE_KEEP_DAYS)).strftime("%Y-%m-%d")
+        for day in [d for d in daily if d < cutoff]:
+            del daily[day]
+        try:
+            os.makedirs(os.path.dirname(USAGE_FILE) or ".", exist_ok=True)
+            tmp = USAGE_FILE + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(daily, f, indent=1, sort_keys=True)
+            os.replace(tmp, USAGE_FILE)
+        except OSError as e:
+            print(f"::warning::Could not save token usage: {e}", flush=True)
+
+def usage_report():
+    with _lock:
+        today = _load_daily().get(_today(), {})
+        return {m: dict(t, total=_sum(t), cost_usd=round(cost(m, t), 6), today=_sum(today.get(m, t)),
+                        dropped=DROPPED.get(m)) for m, t in USAGE.items()}
+
+def print_usage_report():
+    print("\nToken usage:", flush=True)
+    report = usage_report()
+    for m, t in sorted(report.items()):
+        print(f"   [{m}] {t['calls']} calls, {t['prompt']} prompt + {t['completion']} completion + "
+              f"{t['reasoning']} reasoning = {t['total']} tokens (~${t['cost_usd']:.4f}; {t['today']} today)", flush=True)
+    for m, reason in DROPPED.items():
+        if m not in report:
+            print(f"   [{m}] dropped before any call ({reason})", flush=True)
+    print(f"   Run total {run_tokens()} / {RUN_TOKEN_BUDGET}, today {day_tokens()} / {DAILY_TOKEN_BUDGET}", flush=True)
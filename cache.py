@@ -0,0 +1,88 @@
+# cache.py - content-addressed per-article decision cache in front of call_model
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from feeds import CACHE_DIR
+
+# --- Configuration ---
+DECISION_CACHE_FILE = os.path.join(CACHE_DIR, "decisions.db")
+DECISION_CACHE_TTL_DAYS = 7
+DECISION_CACHE_MAX_ENTRIES = 100000
+
+CACHE_STATS = {"hits": 0, "misses": 0, "evicted": 0}
+
+_lock = threading.Lock()
+_conn = None
+
+def decision_key(model_name, prompt, title):
+    title = re.sub(r"\s+", " ", title or "").strip()
+    return hashlib.sha256(f"{model_name}\x00{prompt}\x00{title}".encode("utf-8")).hexdigest()
+
+def _open(path=DECISION_CACHE_FILE):
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _conn = sqlite3.connect(path, check_same_thread=False)
+        _conn.execute("""CREATE TABLE IF NOT EXISTS decisions (
+            key TEXT PRIMARY KEY,
+            selected INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )""")
+        evict(_conn)
+    return _conn
+
+def evict(conn):
+    """Drop expired entries, then the least recently used beyond the size cap"""
+    cutoff = time.time() - DECISION_CACHE_TTL_DAYS * 86400
+    evicted = conn.execute("DELETE FROM decisions WHERE created < ?", (cutoff,)).rowcount
+    overflow = conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0] - DECISION_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted += conn.execute(
+            "DELETE FROM decisions WHERE key IN (SELECT key FROM decisions ORDER BY last_used LIMIT ?)",
+            (overflow,)
+        ).rowcount
+    conn.commit()
+    CACHE_STATS["evicted"] += evicted
+
+def lookup(keys):
+    keys = list(keys)
+    found = {}
+    with _lock:
+        conn = _open()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, selected in conn.execute(f"SELECT key, selected FROM decisions WHERE key IN ({marks})", chunk):
+                found[key] = bool(selected)
+            conn.execute(f"UPDATE decisions SET last_used = ? WHERE key IN ({marks})", [time.time(), *chunk])
+        conn.commit()
+    return found
+
+def remember(decisions):
+    """decisions: {key: selected}"""
+    now = time.time()
+    with _lock:
+        conn = _open()
+        conn.executemany(
+            "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?)",
+            [(key, int(selected), now, now) for key, selected in decisions.items()]
+        )
+        conn.commit()
+
+def cached_votes(model_name, prompt, articles):
+    """Return {article id: selected} for articles this model already judged under this prompt"""
+    keys = {a['id']: decision_key(model_name, prompt, a['title']) for a in articles}
+    known = lookup(keys.values())
+    hits = {aid: known[key] for aid, key in keys.items() if key in known}
+    with _lock:
+        CACHE_STATS["hits"] += len(hits)
+        CACHE_STATS["misses"] += len(keys) - len(hits)
+    return hits
+
+def remember_votes(model_name, prompt, batch, decisions):
+    chosen = {d for d in decisions if isinstance(d, int)}
+    remember({decision_key(model_name, prompt, a['title']): a['id'] in chosen for a in batch})
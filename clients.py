@@ -0,0 +1,120 @@
+# clients.py - pooled, keep-alive HTTP clients, one per provider
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+except ImportError:
+    httpx = None
+
+# --- Configuration ---
+POOL_SIZE = 8
+HTTP2_ENABLED = httpx is not None and os.environ.get("CURATOR_HTTP2", "1") != "0"
+
+_lock = threading.Lock()
+_clients = {}
+
+def _timed(connection_cls, client):
+    class TimedConnection(connection_cls):
+        def connect(self):
+            started = time.monotonic()
+            super().connect()
+            client.record_connect(time.monotonic() - started)
+    return TimedConnection
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools time every TCP+TLS connect on behalf of one client"""
+    def __init__(self, client, **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        http_pool = type("TimedHTTPPool", (HTTPConnectionPool,), {"ConnectionCls": _timed(HTTPConnection, self.client)})
+        https_pool = type("TimedHTTPSPool", (HTTPSConnectionPool,), {"ConnectionCls": _timed(HTTPSConnection, self.client)})
+        self.poolmanager.pool_classes_by_scheme = {"http": http_pool, "https": https_pool}
+
+class ProviderClient:
+    """Long-lived session for one provider, reused by every call in the run"""
+    def __init__(self, name, http2=HTTP2_ENABLED):
+        self.name = name
+        self.requests = 0
+        self.connections = 0
+        self.handshake_seconds = 0.0
+        self.session = requests.Session()
+        # Only connection failures are retried here; HTTP status retries (429 Retry-After
+        # included) belong to backoff.py, so every response reaches call_model
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5, allowed_methods=None,
+                      respect_retry_after_header=False, raise_on_status=False)
+        adapter = _TimedAdapter(self, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.http2 = httpx.Client(http2=True, limits=httpx.Limits(max_keepalive_connections=POOL_SIZE)) if http2 else None
+
+    def record_connect(self, seconds):
+        with _lock:
+            self.connections += 1
+            self.handshake_seconds += seconds
+
+    def _trace(self, tls):
+        started = {}
+        done = "connection.start_tls.complete" if tls else "connection.connect_tcp.complete"
+        def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                started["t"] = time.monotonic()
+            elif event == done and "t" in started:
+                self.record_connect(time.monotonic() - started.pop("t"))
+        return trace
+
+    def post(self, url, **kwargs):
+        with _lock:
+            self.requests += 1
+        if self.http2 is None:
+            return self.session.post(url, **kwargs)
+        try:
+            return self.http2.post(url, extensions={"trace": self._trace(url.startswith("https"))}, **kwargs)
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def get(self, url, **kwargs):
+        with _lock:
+            self.requests += 1
+        return self.session.get(url, **kwargs)
+
+def get_client(provider):
+    with _lock:
+        client = _clients.get(provider)
+        if client is None:
+            client = _clients[provider] = ProviderClient(provider)
+        return client
+
+def connection_report():
+    """Per-provider requests vs. new connections, and the handshake time reuse saved"""
+    report = {}
+    with _lock:
+        for name, client in _clients.items():
+            avg = client.handshake_seconds / client.connections if client.connections else 0.0
+            report[name] = {
+                "requests": client.requests,
+                "connections": client.connections,
+                "handshake_seconds": round(client.handshake_seconds, 3),
+                "saved_seconds": round(max(0, client.requests - client.connections) * avg, 3),
+                "http2": client.http2 is not None,
+            }
+    return report
+
+def print_connection_report():
+    print("\nConnection reuse:", flush=True)
+    total_saved = 0.0
+    for name, r in connection_report().items():
+        total_saved += r["saved_seconds"]
+        print(f"   [{name}] {r['requests']} requests over {r['connections']} connections "
+              f"({r['handshake_seconds']:.2f}s handshaking, ~{r['saved_seconds']:.2f}s saved{', HTTP/2' if r['http2'] else ''})", flush=True)
+    print(f"   Handshake time saved this run: ~{total_saved:.2f}s", flush=True)
@@ -0,0 +1,159 @@
+# cluster.py - offline near-duplicate clustering (MinHash + LSH over character shingles)
+import re
+import hashlib
+from feeds import canonical_link
+
+# --- Configuration ---
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16                 # 16 bands x 4 rows: candidate pairs from roughly 0.5 Jaccard up
+BORDERLINE_MARGIN = 0.15   # Pairs this far below the threshold go to the tie-breaker, if any
+DEDUP_SIMILARITY = 0.85    # Pre-classification dedup only merges near-identical titles
+
+MERSENNE_PRIME = (1 << 61) - 1
+SOURCE_SUFFIX_RE = re.compile(r"\s*\.?\s*\[\s*[^\]]*\]\s*$")
+NON_WORD_RE = re.compile(r"[^\wঀ-৿]+")
+
+def _permutations():
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"perm{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "little") % MERSENNE_PRIME or 1
+        b = int.from_bytes(digest[8:], "little") % MERSENNE_PRIME
+        perms.append((a, b))
+    return perms
+
+PERMUTATIONS = _permutations()
+
+def normalize_title(title):
+    title = SOURCE_SUFFIX_RE.sub("", title or "")
+    return NON_WORD_RE.sub(" ", title.lower()).strip()
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Character k-grams; works the same for Bangla and English"""
+    text = normalize_title(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+def signature(shingle_set):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingle_set]
+    if not hashes:
+        return (0,) * NUM_PERM
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def candidate_pairs(signatures, bands=BANDS):
+    """Ids that share at least one LSH band bucket"""
+    rows = NUM_PERM // bands
+    buckets = {}
+    for aid, sig in signatures.items():
+        for band in range(bands):
+            buckets.setdefault((band, sig[band * rows:(band + 1) * rows]), []).append(aid)
+    pairs = set()
+    for members in buckets.values():
+        if len(members) > 1:
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pairs.add((min(members[i], members[j]), max(members[i], members[j])))
+    return pairs
+
+def cluster_articles(articles, min_similarity=0.5, tie_breaker=None):
+    """Group near-duplicate titles into [{"cluster_id", "main", "members"}].
+
+    Pairs at or above min_similarity are merged. Pairs just below it are handed
+    to tie_breaker(pairs) -> set of pairs to merge, when one is given."""
+    sets = {a['id']: shingles(a['title']) for a in articles}
+    signatures = {aid: signature(s) for aid, s in sets.items()}
+
+    parent = {aid: aid for aid in sets}
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    def union(x, y):
+        rx, ry = find(x), find(y)
+        if rx != ry:
+            parent[max(rx, ry)] = min(rx, ry)
+
+    # Loosen the band width a little so borderline pairs are still found
+    borderline = []
+    for x, y in candidate_pairs(signatures, bands=BANDS if tie_breaker is None else NUM_PERM // 2):
+        sim = jaccard(sets[x], sets[y])
+        if sim >= min_similarity:
+            union(x, y)
+        elif tie_breaker is not None and sim >= min_similarity - BORDERLINE_MARGIN:
+            borderline.append((x, y))
+
+    if borderline and tie_breaker is not None:
+        for x, y in tie_breaker(borderline) or ():
+            if x in parent and y in parent:
+                union(x, y)
+
+    by_id = {a['id']: a for a in articles}
+    groups = {}
+    for aid in sets:
+        groups.setdefault(find(aid), []).append(aid)
+
+    clusters = []
+    for cluster_id, members in enumerate(sorted(groups.values(), key=min)):
+        members.sort()
+        # Prefer the member most models agreed on, then the earliest
+        main = max(members, key=lambda m: (len(by_id[m].get('selected_by', [])), -m))
+        clusters.append({"cluster_id": cluster_id, "main": main, "members": members})
+    return clusters
+
+def dedup_articles(articles, min_similarity=DEDUP_SIMILARITY):
+    """Collapse the same story carried by several feeds before classification.
+
+    Articles are grouped when their canonical links match, their normalized titles
+    match, or their title shingles are near-identical. Returns (representatives,
+    {representative id: [member ids]}) with the earliest article representing each group."""
+    parent = {a['id']: a['id'] for a in articles}
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    def union(x, y):
+        rx, ry = find(x), find(y)
+        if rx != ry:
+            parent[max(rx, ry)] = min(rx, ry)
+
+    first_by_key = {}
+    for a in articles:
+        for key in (("link", canonical_link(a['link'])), ("title", normalize_title(a['title']))):
+            if key[1] and key in first_by_key:
+                union(first_by_key[key], a['id'])
+            else:
+                first_by_key.setdefault(key, a['id'])
+
+    sets = {a['id']: shingles(a['title']) for a in articles}
+    signatures = {aid: signature(s) for aid, s in sets.items()}
+    for x, y in candidate_pairs(signatures):
+        if jaccard(sets[x], sets[y]) >= min_similarity:
+            union(x, y)
+
+    groups = {}
+    for a in articles:
+        groups.setdefault(find(a['id']), []).append(a['id'])
+    by_id = {a['id']: a for a in articles}
+    representatives = [by_id[rep] for rep in sorted(groups)]
+    print(f"Dedup: {len(articles)} articles -> {len(representatives)} unique stories "
+          f"({len(articles) - len(representatives)} cross-feed duplicates)", flush=True)
+    return representatives, groups
+
+def fan_out_votes(votes, groups):
+    """Copy each representative's votes to the duplicates it stood in for"""
+    for rep, members in groups.items():
+        if rep not in votes:
+            continue
+        for member in members:
+            if member != rep:
+                votes[member] = dict(votes[rep])
+    return votes
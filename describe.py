@@ -0,0 +1,162 @@
+# describe.py - compact, sanitized item descriptions for the output feeds
+import re
+import hashlib
+from datetime import datetime
+from html import escape
+from urllib.parse import urlsplit
+from lxml import etree, html as lxml_html
+from feeds import canonical_link
+
+# --- Configuration ---
+DESCRIPTION_IMAGES = "url"          # "keep" (src/alt/width), "url" (bare <img src>) or "drop"
+DESCRIPTION_MAX_CHARS = 280         # Upstream text beyond this is cut to plain text
+DESCRIPTION_BUDGET_BYTES = 48000    # Per feed and run; later items get the header line only
+
+ALLOWED_TAGS = {"p", "a", "b", "i", "em", "strong", "br", "ul", "ol", "li", "blockquote", "img", "small"}
+REMOVED_TAGS = {"script", "style", "iframe", "noscript", "form", "object", "embed", "svg"}
+BLOCK_TAGS = {"p", "li", "blockquote", "div"}
+SAFE_URL_SCHEMES = {"http", "https", "mailto"}
+MORE_LINK_TEXTS = {"বিস্তারিত", "আরও পড়ুন", "বিস্তারিত পড়ুন", "read more", "continue reading", "more", "details"}
+
+WHITESPACE_RE = re.compile(r"\s+")
+URL_IGNORED_RE = re.compile(r"[\x00-\x20\x7f]+")   # Browsers skip these inside a scheme ("java\tscript:")
+
+def legacy_description(art, related=""):
+    """The description save_xml used to emit, kept to measure what the renderer saves"""
+    models_str = ", ".join(art.get('selected_by', ['Unknown']))
+    html_desc = f"<p><b>[{art.get('category', 'News')}]</b></p>"
+    html_desc += f"<p><i>{art.get('reason', 'Selected')}</i></p>"
+    html_desc += f"<p><small>Selected by: {models_str}</small></p>"
+    html_desc += f"<hr/><p>{art.get('description', '')}</p>"
+    return html_desc + related
+
+def safe_url(url):
+    """The URL if its scheme is http, https or mailto, else None (javascript:, data:, relative...)"""
+    if not url:
+        return None
+    try:
+        scheme = urlsplit(URL_IGNORED_RE.sub("", url)).scheme.lower()
+    except ValueError:
+        return None
+    return url.strip() if scheme in SAFE_URL_SCHEMES else None
+
+def _text(el):
+    return WHITESPACE_RE.sub(" ", el.text_content()).strip()
+
+def _is_more_link(a, link):
+    text = _text(a).lower()
+    return text in MORE_LINK_TEXTS or (not text and canonical_link(a.get("href", "")) == canonical_link(link or ""))
+
+def minimize_html(fragment, link=None, seen=None, images=DESCRIPTION_IMAGES, max_chars=DESCRIPTION_MAX_CHARS):
+    """Sanitize an upstream description down to a few allowed tags.
+
+    Drops "read more" links, images per `images`, and any block whose text was
+    already seen in this feed (`seen` is a set of block hashes shared across items)."""
+    if not fragment or not fragment.strip():
+        return ""
+    try:
+        root = lxml_html.fragment_fromstring(fragment, create_parent="div")
+    except (etree.ParserError, ValueError):
+        return escape(WHITESPACE_RE.sub(" ", fragment).strip()[:max_chars])
+
+    for el in list(root.iter()):
+        if el is root or not isinstance(el.tag, str):
+            continue
+        if el.tag in REMOVED_TAGS:
+            el.drop_tree()
+        elif el.tag == "img":
+            src = safe_url(el.get("src"))
+            if images == "drop" or not src:
+                el.drop_tree()
+                continue
+            kept = {k: el.get(k) for k in (("alt", "width") if images == "keep" else ()) if el.get(k)}
+            el.attrib.clear()
+            el.set("src", src)
+            el.attrib.update(kept)
+        elif el.tag == "a":
+            if _is_more_link(el, link):
+                el.drop_tree()
+                continue
+            href = safe_url(el.get("href"))
+            if not href:
+                el.drop_tag()
+                continue
+            el.attrib.clear()
+            el.set("href", href)
+        elif el.tag not in ALLOWED_TAGS:
+            el.drop_tag()
+        else:
+            el.attrib.clear()
+
+    for el in list(root.iter(*BLOCK_TAGS)):
+        if el is root or el.getparent() is None:
+            continue
+        text = _text(el)
+        if not text and el.find(".//img") is None:
+            el.drop_tag()
+            continue
+        if seen is not None and text:
+            key = hashlib.sha1(text.encode("utf-8")).digest()
+            if key in seen:
+                el.drop_tree()
+            else:
+                seen.add(key)
+
+    text = _text(root)
+    if len(text) > max_chars:
+        cut = text[:max_chars].rsplit(" ", 1)[0]
+        first_img = root.find(".//img")
+        img_html = etree.tostring(first_img, encoding="unicode", method="html", with_tail=False) if first_img is not None else ""
+        return f"{img_html}<p>{escape(cut)}…</p>"
+    inner = escape(root.text or "") + "".join(etree.tostring(child, encoding="unicode", method="html") for child in root)
+    return inner.strip()
+
+def _list_item(title, link, prefix=""):
+    title = escape(WHITESPACE_RE.sub(" ", title or "").strip())
+    href = safe_url(link)
+    anchor = f'<a href="{escape(href)}">{title}</a>' if href else title
+    return f"<li>{escape(prefix)}{anchor}</li>"
+
+def related_html(art):
+    """The "Similar items" (art['similar']) and "Earlier coverage" (art['prior_coverage'])
+    lists, escaped and scheme-checked here rather than trusted as markup"""
+    html_desc = ""
+    similar = art.get('similar') or []
+    if similar:
+        html_desc += "<p><b>Similar items:</b></p><ul>" + "".join(_list_item(s.get('title'), s.get('link')) for s in similar) + "</ul>"
+    prior = art.get('prior_coverage') or []
+    if prior:
+        html_desc += "<p><b>Earlier coverage:</b></p><ul>" + "".join(
+            _list_item(p.get('title'), p.get('link'), datetime.fromtimestamp(p['seen']).strftime("%d %b") + ": ")
+            for p in prior) + "</ul>"
+    return "<hr/>" + html_desc if html_desc else ""
+
+class DescriptionRenderer:
+    """Renders the descriptions of one feed, holding its byte budget and savings tally"""
+    def __init__(self, budget=DESCRIPTION_BUDGET_BYTES):
+        self.budget = budget
+        self.used = 0
+        self.original = 0
+        self.trimmed = 0
+        self.seen = set()
+
+    def render(self, art):
+        models_str = ", ".join(art.get('selected_by', ['Unknown']))
+        header = (f"<p><small><b>[{art.get('category', 'News')}]</b> {art.get('reason', 'Selected')}"
+                  f" · Selected by: {models_str}</small></p>")
+        related = related_html(art)
+        body = minimize_html(art.get('description', ''), art.get('link'), self.seen)
+        html_desc = header + (f"<hr/>{body}" if body else "") + related
+        if self.used + len(html_desc.encode("utf-8")) > self.budget:
+            html_desc = header + related
+            self.trimmed += 1
+        self.used += len(html_desc.encode("utf-8"))
+        self.original += len(legacy_description(art, related).encode("utf-8"))
+        return html_desc
+
+    def summary(self, name):
+        saved = self.original - self.used
+        share = saved / self.original * 100 if self.original else 0.0
+        trimmed = f", {self.trimmed} over budget" if self.trimmed else ""
+        return (f"   Descriptions for {name}: {self.original} -> {self.used} bytes "
+                f"(saved {saved}, {share:.0f}%{trimmed})")
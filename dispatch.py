@@ -0,0 +1,188 @@
+# dispatch.py - rate-limit-aware parallel model dispatcher
+import re
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import record_wait
+from budget import admit
+from backoff import set_stop_event
+
+# --- Configuration ---
+# Fallback (requests/min, tokens/min) when a MODELS entry has no "rpm"/"tpm".
+# Groq and Gemini meter quota per model, so every MODELS entry gets its own limiter.
+DEFAULT_LIMITS = {
+    "groq": (30, 6000),
+    "google": (15, 250000),
+    "openrouter": (20, 100000),
+    "mistral": (60, 500000),
+    "fyra": (10, 100000),
+}
+
+DEFAULT_CONTEXT = 32768
+TPM_HEADROOM = 0.9             # Never pack a single batch above 90% of a minute's token quota
+OUTPUT_TOKENS_PER_ITEM = 4     # Room for the id to come back in the JSON array
+OUTPUT_TOKENS_RESERVE = 1024   # Reasoning models think before answering
+
+# Approximate characters per token (Latin, Bangla) by tokenizer family, matched on model name.
+# Bangla is poorly covered by most vocabularies and costs several times more per character.
+TOKENIZER_RATIOS = [
+    ("gpt-oss", (4.2, 2.5)),
+    ("gemini", (4.0, 3.0)),
+    ("llama", (4.0, 1.6)),
+    ("qwen", (3.8, 1.3)),
+    ("kimi", (4.0, 1.5)),
+    ("mistral", (3.6, 1.0)),
+]
+DEFAULT_RATIOS = (4.0, 1.5)
+
+BANGLA_RE = re.compile("[\u0980-\u09FF]")
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available (amount is capped at capacity)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets that must both admit a call"""
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens, stop=None):
+        """Seconds waited, or None when `stop` was set during the wait"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return waited
+            if stop is None:
+                time.sleep(delay)
+            elif stop.wait(delay):
+                return None
+            waited += delay
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(model_info):
+    """One limiter per model name for the whole run, so bucket state carries across
+    waves, cascade tiers and MODELS entries that share a provider quota"""
+    with _limiters_lock:
+        limiter = _limiters.get(model_info['name'])
+        if limiter is None:
+            default_rpm, default_tpm = DEFAULT_LIMITS.get(model_info.get("api", "groq"), (30, 6000))
+            limiter = _limiters[model_info['name']] = RateLimiter(model_info.get("rpm", default_rpm),
+                                                                   model_info.get("tpm", default_tpm))
+        return limiter
+
+def tokenizer_ratios(model_name):
+    for family, ratios in TOKENIZER_RATIOS:
+        if family in model_name.lower():
+            return ratios
+    return DEFAULT_RATIOS
+
+def count_tokens(text, model_name):
+    latin_ratio, bangla_ratio = tokenizer_ratios(model_name)
+    bangla = len(BANGLA_RE.findall(text))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    other = len(text) - bangla - ascii_chars
+    return int(ascii_chars / latin_ratio + bangla / bangla_ratio + other / 2) + 1
+
+def estimate_tokens(model_info, system_prompt, batch):
+    """Prompt tokens plus the reply we expect, as the provider will meter them"""
+    name = model_info['name']
+    prompt = count_tokens(system_prompt, name) + sum(count_tokens(f"{a['id']}: {a['title']}\n", name) for a in batch)
+    return prompt + OUTPUT_TOKENS_RESERVE + OUTPUT_TOKENS_PER_ITEM * len(batch)
+
+def batch_token_budget(model_info):
+    default_rpm, default_tpm = DEFAULT_LIMITS.get(model_info.get("api", "groq"), (30, 6000))
+    tpm = model_info.get("tpm", default_tpm)
+    return int(min(model_info.get("context", DEFAULT_CONTEXT), tpm * TPM_HEADROOM))
+
+def pack_batches(model_info, system_prompt, articles):
+    """Greedily fill each batch up to the model's token budget, capped at batch_size items"""
+    name = model_info['name']
+    budget = batch_token_budget(model_info) - count_tokens(system_prompt, name) - OUTPUT_TOKENS_RESERVE
+    max_items = model_info.get("batch_size", len(articles)) or 1
+    batches, current, used = [], [], 0
+    for a in articles:
+        cost = count_tokens(f"{a['id']}: {a['title']}\n", name) + OUTPUT_TOKENS_PER_ITEM
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(a)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def dispatch(units, call, estimate):
+    """Run (model_info, batch) units, one worker per model, and yield
+    (model_info, batch, result) as each call completes. Closing the generator
+    early stops the workers: a limiter wait or backoff sleep ends at once and
+    call() gives up at its next retry (see backoff.stop_requested)."""
+    by_model = {}
+    for model_info, batch in units:
+        by_model.setdefault(model_info['name'], (model_info, []))[1].append(batch)
+
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def worker(model_info, batches):
+        set_stop_event(stop)
+        limiter = limiter_for(model_info)
+        for batch in batches:
+            if stop.is_set():
+                return
+            tokens = estimate(model_info, batch)
+            if not admit(model_info, tokens):
+                results.put((model_info, batch, None))
+                continue
+            waited = limiter.acquire(tokens, stop)
+            if waited is None or stop.is_set():
+                return
+            record_wait(model_info.get("api", "groq"), model_info['name'], waited)
+            if waited >= 1:
+                print(f"    [{model_info['display']}] Rate limiter held call for {waited:.1f}s", flush=True)
+            try:
+                result = call(model_info, batch)
+            except Exception as e:
+                print(f"    [{model_info['display']}] Dispatch error: {e}", flush=True)
+                result = None
+            results.put((model_info, batch, result))
+
+    if not by_model:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(by_model)) as pool:
+        for model_info, batches in by_model.values():
+            pool.submit(worker, model_info, batches)
+        try:
+            for _ in range(len(units)):
+                yield results.get()
+        finally:
+            # The consumer is gone (SIGTERM, error): only the calls already in flight finish
+            stop.set()
@@ -0,0 +1,168 @@
+# feeds.py - shared source feed fetch layer for main.py, m.py and bmain.py
+import os
+import json
+import time
+import hashlib
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from lxml import etree
+from clients import get_client
+
+# --- Configuration ---
+CACHE_DIR = os.environ.get("CURATOR_CACHE_DIR", ".cache")
+FEED_CACHE_DIR = os.path.join(CACHE_DIR, "feeds")
+VALIDATORS_FILE = os.path.join(FEED_CACHE_DIR, "validators.json")
+
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+USER_AGENT = "BCS-Curator/3.0-Ensemble"
+
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "source", "cmpid"}
+
+HEADERS = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+
+FETCH_STATS = {"requests": 0, "seconds": 0.0}   # Time spent in feed requests, summed over workers
+_stats_lock = threading.Lock()
+
+def load_validators():
+    try:
+        with open(VALIDATORS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_validators(validators):
+    os.makedirs(FEED_CACHE_DIR, exist_ok=True)
+    tmp = VALIDATORS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(validators, f, indent=1, sort_keys=True)
+    os.replace(tmp, VALIDATORS_FILE)
+
+def cache_path(url):
+    return os.path.join(FEED_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".xml")
+
+def fetch_one(url, validator=None):
+    """Conditional GET of one feed; returns (status, body_path, new_validator)"""
+    path = cache_path(url)
+    headers = dict(HEADERS)
+    if validator and os.path.exists(path):
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+
+    started = time.monotonic()
+    with get_client("feeds").get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as r:
+        if r.status_code == 304:
+            print(f"  [fetch] {url}: not modified ({time.monotonic() - started:.2f}s)", flush=True)
+            return 304, path, validator
+
+        if r.status_code != 200:
+            print(f"  [fetch] {url}: HTTP {r.status_code}", flush=True)
+            return r.status_code, None, validator
+
+        # Stream the (transparently decompressed) body straight to the cache
+        os.makedirs(FEED_CACHE_DIR, exist_ok=True)
+        tmp = path + ".part"
+        size = 0
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, path)
+
+        new_validator = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        print(f"  [fetch] {url}: {size} bytes ({time.monotonic() - started:.2f}s)", flush=True)
+        return 200, path, new_validator
+
+def fetch_feeds(urls):
+    """Fetch all feeds concurrently; returns cached body paths in URL order (None on failure)"""
+    validators = load_validators()
+    results = {}
+
+    def worker(url):
+        started = time.monotonic()
+        try:
+            return fetch_one(url, validators.get(url))
+        except requests.exceptions.RequestException as e:
+            print(f"  [fetch] {url}: {type(e).__name__}", flush=True)
+            return None, None, validators.get(url)
+        finally:
+            with _stats_lock:
+                FETCH_STATS["requests"] += 1
+                FETCH_STATS["seconds"] += time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(urls)))) as pool:
+        for url, (status, path, validator) in zip(urls, pool.map(worker, urls)):
+            results[url] = path
+            if status == 200 and validator:
+                validators[url] = validator
+
+    try:
+        save_validators(validators)
+    except OSError as e:
+        print(f"::warning::Could not save feed validators: {e}", flush=True)
+
+    print(f"Fetched {sum(1 for p in results.values() if p)}/{len(urls)} feeds in {time.monotonic() - started:.2f}s", flush=True)
+    return [results[url] for url in urls]
+
+def canonical_link(link):
+    """Normalize a link so the same article is keyed identically across feeds and runs"""
+    parts = urlsplit((link or "").strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."): host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+def parse_pub_date(pub_date):
+    try:
+        dt = parsedate_to_datetime(pub_date)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None: return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def iter_articles(path, cutoff_time, seen_links):
+    """Stream <item>s out of a cached feed, yielding only fresh, unseen articles"""
+    context = etree.iterparse(path, events=("end",), tag="item", huge_tree=True, remove_blank_text=True)
+    for _, item in context:
+        fields = {}
+        for child in item:
+            if isinstance(child.tag, str) and child.tag not in fields:
+                fields[child.tag] = child.text or ""
+
+        # Free the element and everything already walked before it
+        item.clear()
+        parent = item.getparent()
+        if parent is not None:
+            while item.getprevious() is not None:
+                del parent[0]
+
+        pub_date = fields.get("pubDate", "").strip()
+        if not pub_date: continue
+        dt = parse_pub_date(pub_date)
+        if dt is None or dt < cutoff_time: continue
+
+        # Fallback to guid if link is missing or empty
+        link = (fields.get("link") or fields.get("guid") or "").strip()
+        if not link or link in seen_links: continue
+        seen_links.add(link)
+
+        title = (fields.get("title") or "No Title").strip()
+        yield {
+            "title": title,
+            "link": link,
+            "description": fields.get("description") or title,
+            "pubDate": pub_date
+        }
+    del context
@@ -1,15 +1,45 @@
 import os
 import json
 import requests
-import time
 import sys
+import signal
+import argparse
 import re
-from xml.etree import ElementTree as ET
 from datetime import datetime, timedelta, timezone
-from email.utils import parsedate_to_datetime
+from feeds import fetch_feeds, iter_articles
+from rss import write_feeds
+from router import FeedRouter
+from clients import get_client, print_connection_report
+from cache import CACHE_STATS
+from voting import collect_votes, tally, screen_articles, new_tier, finish_tier, print_tier_summary
+from prefilter import prefilter_articles
+from cluster import dedup_articles, fan_out_votes
+from backoff import MAX_RETRY_WAIT, observe, retry_delay, backoff_sleep, wait_for_quota, stop_requested, rate_limit_report
+from metrics import record_response, record_error, note, write_run_report
+from budget import record_usage, print_usage_report, save_usage
+from profiling import stage, enable_profiling, write_profile_report
+from artifacts import ARTIFACT_DIR, ARTICLES_FILE, VOTES_FILE, SELECTION_FILE, describe
+from artifacts import save_articles, load_articles, save_vote_matrix, load_vote_matrix, save_selection, load_selection
 
 # --- Configuration ---
 MAX_FEED_ITEMS = 100
+INCREMENTAL_FEEDS = True  # Merge into the published feeds as a rolling window of MAX_FEED_ITEMS
+PAGED_FEEDS = True        # Archive pages, JSON Feed and .gz copies (needs INCREMENTAL_FEEDS)
+
+# Consensus: an article needs CONSENSUS_MIN_VOTES model votes. With early-exit voting
+# the models are asked in MODELS order, VOTING_WAVE_SIZE at a time, and an article
+# leaves later waves as soon as its outcome is decided.
+CONSENSUS_MIN_VOTES = 2
+EARLY_EXIT_VOTING = True
+VOTING_WAVE_SIZE = 2
+
+# Drop obvious STEP 1 noise (sports, entertainment, tributes...) locally before any model call
+PREFILTER_ENABLED = True
+
+# Two-tier cascade: a cheap screener with SCREEN_PROMPT sees every article first and
+# only its survivors go to the full MODELS ensemble
+CASCADE_ENABLED = True
+SCREENER = {"name": "openai/gpt-oss-20b", "display": "Screener GPT-OSS-20B", "batch_size": 100, "api": "groq", "rpm": 30, "tpm": 8000, "context": 131072}
 
 URLS = [
     "https://evilgodfahim.github.io/bdit/daily_feed_2.xml",
@@ -17,42 +47,62 @@ URLS = [
     "https://evilgodfahim.github.io/edit/daily_feed.xml"
 ]
 
+# batch_size caps items per request; batches are packed up to each model's
+# context and tpm budget by dispatch.pack_batches
 MODELS = [
     {
         "name": "`groq/compound-beta`",
         "display": "Compound But Mini",
-        "batch_size": 25,
-        "api": "groq"
+        "batch_size": 100,
+        "api": "groq",
+        "rpm": 30,
+        "tpm": 70000,
+        "context": 131072
     },
     {
         "name": "llama-3.3-70b-versatile",
         "display": "Llama-3.3-70B",
-        "batch_size": 25,
-        "api": "groq"
+        "batch_size": 100,
+        "api": "groq",
+        "rpm": 30,
+        "tpm": 12000,
+        "context": 131072
     },
     {
         "name": "qwen/qwen3-32b",
         "display": "Qwen-3-32B",
-        "batch_size": 25,
-        "api": "groq"
+        "batch_size": 100,
+        "api": "groq",
+        "rpm": 60,
+        "tpm": 6000,
+        "context": 131072
     },
     {
         "name": "openai/gpt-oss-120b",
         "display": "GPT-OSS-120B",
-        "batch_size": 25,
-        "api": "groq"
+        "batch_size": 100,
+        "api": "groq",
+        "rpm": 30,
+        "tpm": 8000,
+        "context": 131072
     },
     {
         "name": "openai/gpt-oss-20b",
         "display": "GPT-OSS-20",
-        "batch_size": 25,
-        "api": "groq"
+        "batch_size": 100,
+        "api": "groq",
+        "rpm": 30,
+        "tpm": 8000,
+        "context": 131072
     },
     {
         "name": "gemini-2.5-flash-lite",
         "display": "Gemini-2.5-Flash-Lite",
         "batch_size": 500,
-        "api": "google"
+        "api": "google",
+        "rpm": 15,
+        "tpm": 250000,
+        "context": 1048576
     }
 ]
 
@@ -94,63 +144,20 @@ No markdown.
 No commentary.
 No text outside JSON."""
 
-def is_bangla(text):
-    """Check if text contains Bangla characters"""
-    bangla_range = range(0x0980, 0x09FF)
-    return any(ord(char) in bangla_range for char in text)
-
-def save_xml(data, filename, error_message=None):
-    os.makedirs(os.path.dirname(filename) if os.path.dirname(filename) else ".", exist_ok=True)
-
-    rss = ET.Element("rss", version="2.0")
-    channel = ET.SubElement(rss, "channel")
-
-    feed_title = "Elite News Feed"
-    if "overflow" in filename:
-        feed_title += " (English)"
-    else:
-        feed_title += " (Bangla)"
-
-    ET.SubElement(channel, "title").text = feed_title
-    ET.SubElement(channel, "lastBuildDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    ET.SubElement(channel, "link").text = "https://github.com/evilgodfahim"
-    ET.SubElement(channel, "description").text = "AI-curated structural news feed"
-
-    if error_message:
-        item = ET.SubElement(channel, "item")
-        ET.SubElement(item, "title").text = "System Error"
-        ET.SubElement(item, "description").text = f"Script failed: {error_message}"
-        ET.SubElement(item, "pubDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    elif not data:
-        item = ET.SubElement(channel, "item")
-        ET.SubElement(item, "title").text = "End of Feed"
-        ET.SubElement(item, "description").text = "No additional articles in this feed."
-        ET.SubElement(item, "pubDate").text = datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
-    else:
-        for art in data:
-            item = ET.SubElement(channel, "item")
-            ET.SubElement(item, "title").text = art['title']
-            ET.SubElement(item, "link").text = art['link']
-            ET.SubElement(item, "pubDate").text = art['pubDate']
-
-            models_str = ", ".join(art.get('selected_by', ['Unknown']))
-            category_info = art.get('category', 'News')
-            reason_info = art.get('reason', 'Selected')
-
-            html_desc = f"<p><b>[{category_info}]</b></p>"
-            html_desc += f"<p><i>{reason_info}</i></p>"
-            html_desc += f"<p><small>Selected by: {models_str}</small></p>"
-            html_desc += f"<hr/><p>{art['description']}</p>"
-
-            ET.SubElement(item, "description").text = html_desc
-
-    try:
-        tree = ET.ElementTree(rss)
-        ET.indent(tree, space="  ", level=0)
-        tree.write(filename, encoding="utf-8", xml_declaration=True)
-        print(f"   Saved {len(data) if data else 0} items to {filename}", flush=True)
-    except Exception as e:
-        print(f"::error::Failed to write XML {filename}: {e}", flush=True)
+# Recall-biased variant for the cascade screener: only clear noise is rejected here
+SCREEN_PROMPT = SYSTEM_PROMPT.replace(
+    "WHEN IN DOUBT → reject.",
+    "WHEN IN DOUBT → keep. This is a first-pass screen: reject only headlines that clearly fail STEP 1 "
+    "or are plainly single-country internal affairs with no cross-border or national-scale angle."
+)
+
+def save_feeds(articles, error_message=None):
+    """Route every article to its feed (router.FEED_ROUTES) in one pass.
+    Returns the router, which counts articles per feed, and the items now in each feed."""
+    router = FeedRouter()
+    counts = write_feeds(articles, router, filenames=router.filenames, error_message=error_message,
+                         window=MAX_FEED_ITEMS if INCREMENTAL_FEEDS else None, paged=PAGED_FEEDS)
+    return router, counts
 
 def fetch_titles_only():
     all_articles = []
@@ -159,49 +166,12 @@ def fetch_titles_only():
     cutoff_time = now - timedelta(hours=26)
 
     print(f"Time Filter: Articles after {cutoff_time.strftime('%Y-%m-%d %H:%M UTC')}", flush=True)
-    headers = {'User-Agent': 'BCS-Curator/3.0-Ensemble'}
 
-    for url in URLS:
+    for path in fetch_feeds(URLS):
+        if not path: continue
         try:
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.status_code != 200: continue
-
-            try:
-                root = ET.fromstring(r.content)
-            except: continue
-
-            for item in root.findall('.//item'):
-                pub_date = item.find('pubDate').text if item.find('pubDate') is not None else ""
-                if not pub_date: continue
-
-                try:
-                    dt = parsedate_to_datetime(pub_date)
-                    if dt.tzinfo is None: dt = dt.replace(tzinfo=timezone.utc)
-                    else: dt = dt.astimezone(timezone.utc)
-                    if dt < cutoff_time: continue
-                except: continue
-
-                link = item.find('link').text or ""
-                if not link:
-                    guid = item.find('guid')
-                    link = guid.text if guid is not None else ""
-
-                if not link or link in seen_links: continue
-
-                title = item.find('title').text or "No Title"
-                title = title.strip()
-                seen_links.add(link)
-
-                desc = item.find('description')
-                desc_text = desc.text if desc is not None else ""
-
-                all_articles.append({
-                    "id": len(all_articles),
-                    "title": title,
-                    "link": link,
-                    "description": desc_text or title,
-                    "pubDate": pub_date
-                })
+            for art in iter_articles(path, cutoff_time, seen_links):
+                all_articles.append({"id": len(all_articles), **art})
         except Exception: continue
 
     print(f"Loaded {len(all_articles)} unique headlines", flush=True)
@@ -220,7 +190,8 @@ def extract_json_from_text(text):
         pass
     return None
 
-def call_model(model_info, batch):
+def call_model(model_info, batch, system_prompt=None):
+    system_prompt = system_prompt or SYSTEM_PROMPT
     prompt_list = [f"{a['id']}: {a['title']}" for a in batch]
     prompt_text = "\n".join(prompt_list)
 
@@ -235,7 +206,7 @@ def call_model(model_info, batch):
         payload = {
             "contents": [{
                 "parts": [{
-                    "text": f"{SYSTEM_PROMPT}\n\n{prompt_text}"
+                    "text": f"{system_prompt}\n\n{prompt_text}"
                 }]
             }],
             "generationConfig": {
@@ -252,22 +223,28 @@ def call_model(model_info, batch):
         payload = {
             "model": model_info["name"],
             "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt_text}
             ],
             "temperature": 0.3
         }
 
     max_retries = 5
-    base_wait = 30
+    m_name = model_info['name']
 
     for attempt in range(max_retries):
         try:
-            response = requests.post(api_url, headers=headers, json=payload, timeout=90)
+            wait_for_quota(m_name)
+            if stop_requested():
+                return None
+            response = get_client(api_type).post(api_url, headers=headers, json=payload, timeout=90)
+            observe(m_name, response)
+            record_response(api_type, m_name, response)
 
             if response.status_code == 200:
                 try:
                     response_data = response.json()
+                    record_usage(m_name, response_data, len(batch))
 
                     if 'error' in response_data:
                         print(f"    [{model_info['display']}] API Error: {response_data.get('error', 'Unknown error')}", flush=True)
@@ -278,8 +255,10 @@ def call_model(model_info, batch):
                     else:
                         content = response_data['choices'][0]['message']['content'].strip()
 
-                except (KeyError, IndexError) as e:
+                except (KeyError, IndexError, ValueError) as e:
+                    # ValueError: a body that is not JSON (requests and httpx both raise a JSONDecodeError)
                     print(f"    [{model_info['display']}] Response parse error: {e}", flush=True)
+                    record_error(api_type, m_name, "json_errors")
                     continue
 
                 if content.startswith("```"):
@@ -290,16 +269,21 @@ def call_model(model_info, batch):
                     return parsed_data
                 else:
                     print(f"    [{model_info['display']}] JSON error (Attempt {attempt+1})", flush=True)
+                    record_error(api_type, m_name, "json_errors")
 
             elif response.status_code == 429:
-                wait_time = base_wait * (2 ** attempt)
-                print(f"    [{model_info['display']}] Rate Limit (429). Cooling down {wait_time}s...", flush=True)
-                time.sleep(wait_time)
+                wait_time = retry_delay(response, attempt)
+                if wait_time > MAX_RETRY_WAIT:
+                    print(f"    [{model_info['display']}] Rate Limit (429) resets in {wait_time:.0f}s — quota exhausted, giving up.", flush=True)
+                    break
+                print(f"    [{model_info['display']}] Rate Limit (429). Cooling down {wait_time:.1f}s... {rate_limit_report()[m_name]['last']}", flush=True)
+                backoff_sleep(m_name, wait_time)
                 continue
 
             elif response.status_code >= 500:
-                print(f"    [{model_info['display']}] Server Error {response.status_code}. Retrying...", flush=True)
-                time.sleep(10)
+                wait_time = min(retry_delay(response, attempt), MAX_RETRY_WAIT)
+                print(f"    [{model_info['display']}] Server Error {response.status_code}. Retrying in {wait_time:.1f}s...", flush=True)
+                backoff_sleep(m_name, wait_time)
                 continue
 
             else:
@@ -307,23 +291,21 @@ def call_model(model_info, batch):
                 if 400 <= response.status_code < 500:
                     print(f"    [{model_info['display']}] Client error — breaking retry loop.", flush=True)
                     break
-                time.sleep(5)
+                backoff_sleep(m_name, retry_delay(response, attempt))
                 continue
 
         except requests.exceptions.RequestException as e:
             print(f"    [{model_info['display']}] Net Error. Retrying...", flush=True)
-            time.sleep(5)
+            record_error(api_type, m_name, "net_errors")
+            backoff_sleep(m_name, retry_delay(None, attempt))
+            continue
 
-        time.sleep(2)
+        backoff_sleep(m_name, retry_delay(None, 0))
 
     print(f"    [{model_info['display']}] Failed after {max_retries} attempts.", flush=True)
-    return []
-
-def main():
-    print("=" * 60, flush=True)
-    print("Elite News Curator - Multi-API Ensemble", flush=True)
-    print("=" * 60, flush=True)
+    return None
 
+def check_api_keys():
     if not GROQ_API_KEY:
         print("::error::GEM environment variable is missing!", flush=True)
         sys.exit(1)
@@ -333,82 +315,137 @@ def main():
         print("::error::LAM environment variable is missing!", flush=True)
         sys.exit(1)
 
-    articles = fetch_titles_only()
-    if not articles:
-        print("No articles found.", flush=True)
-        save_xml([], "filtered_feed.xml")
-        save_xml([], "filtered_feed_overflow.xml")
-        return
-
-    # Process batches
-    model_batches = {}
-    for model_info in MODELS:
-        bs = model_info['batch_size']
-        model_batches[model_info['name']] = [articles[i:i + bs] for i in range(0, len(articles), bs)]
-
-    max_batch_count = max(len(batches) for batches in model_batches.values())
-    MAX_BATCHES_LIMIT = 20
-    selections_map = {}
-
-    print(f"\nProcessing {min(max_batch_count, MAX_BATCHES_LIMIT)} Batch Groups...", flush=True)
-
-    for batch_idx in range(min(MAX_BATCHES_LIMIT, max_batch_count)):
-        print(f"  Batch Group {batch_idx+1}...", flush=True)
-
-        for model_info in MODELS:
-            m_name = model_info['name']
-            if batch_idx >= len(model_batches[m_name]): continue
+def fetch_stage():
+    with stage("fetch"):
+        articles = fetch_titles_only()
+    save_articles(articles)
+    return articles
+
+def classify_stage(articles):
+    """Cascade and ensemble votes for every article; saves and returns the vote matrix"""
+    with stage("classify"):
+        # Classify one representative per cross-feed duplicate group; ids still index into articles
+        candidates, duplicate_groups = dedup_articles(articles)
+        candidates = prefilter_articles(candidates, SYSTEM_PROMPT) if PREFILTER_ENABLED else candidates
+
+        # Process batches
+        MAX_BATCHES_LIMIT = 20
+        tiers = []
+        if CASCADE_ENABLED:
+            print(f"\nTier 1 - screening {len(candidates)} articles with {SCREENER['display']}...", flush=True)
+            tier = new_tier("Screener", candidates)
+            candidates = screen_articles(candidates, SCREENER, SCREEN_PROMPT, call_model, tier, max_batches=MAX_BATCHES_LIMIT)
+            tiers.append(finish_tier(tier, candidates))
+            print(f"\nTier 2 - ensemble on {len(candidates)} survivors...", flush=True)
+
+        tier = new_tier("Ensemble", candidates)
+        votes = collect_votes(candidates, MODELS, SYSTEM_PROMPT, call_model, CONSENSUS_MIN_VOTES,
+                              wave_size=VOTING_WAVE_SIZE if EARLY_EXIT_VOTING else None,
+                              max_batches=MAX_BATCHES_LIMIT, stats=tier)
+        fan_out_votes(votes, duplicate_groups)
+        selections_map = tally(votes, MODELS)
+    save_vote_matrix(votes, articles, MODELS, CONSENSUS_MIN_VOTES, EARLY_EXIT_VOTING)
+    tiers.append(finish_tier(tier, [aid for aid, info in selections_map.items() if info['count'] >= CONSENSUS_MIN_VOTES]))
+    print_tier_summary(tiers)
+    note("tiers", tiers)
+
+    print("\nRate limits observed:", flush=True)
+    for m_name, seen in rate_limit_report().items():
+        print(f"   [{m_name}] {seen['responses']} responses, {seen['retries_429']}x 429, {seen['retries_5xx']}x 5xx, "
+              f"slept {seen['sleep_seconds']:.1f}s, last {seen['last']}", flush=True)
+    print(f"Decision cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['misses']} misses, {CACHE_STATS['evicted']} evicted", flush=True)
+    print_connection_report()
+    print_usage_report()
+    return votes
+
+def merge_stage(articles, votes):
+    """Only keep articles selected by at least CONSENSUS_MIN_VOTES models; saves the selection"""
+    with stage("merge"):
+        selections_map = tally(votes, MODELS)
+        final_articles = []
+        print(f"\nMerging ({CONSENSUS_MIN_VOTES}+ model consensus required)...", flush=True)
+        for aid, info in selections_map.items():
+            if len(info['models']) >= CONSENSUS_MIN_VOTES:
+                original = articles[aid].copy()
+                original['category'] = 'Priority'
+                original['reason'] = 'Systemic Significance'
+                original['selected_by'] = info['models']
+                final_articles.append(original)
+    save_selection(final_articles)
+
+    print(f"   ✅ {len(final_articles)} articles passed {CONSENSUS_MIN_VOTES}+ model consensus from {len(selections_map)} total selections", flush=True)
+    return final_articles
+
+def render_stage(final_articles, analyzed):
+    # Route to the configured feeds (Bangla main, English overflow), streamed in one pass
+    with stage("render"):
+        router, counts = save_feeds(final_articles)
 
-            decisions = call_model(model_info, model_batches[m_name][batch_idx])
-
-            if decisions:
-                print(f"    [{model_info['display']}] Selected {len(decisions)} articles", flush=True)
-                for aid in decisions:
-                    if isinstance(aid, int) and aid < len(articles):
-                        if aid not in selections_map:
-                            selections_map[aid] = {'models': [], 'count': 0}
-                        selections_map[aid]['models'].append(model_info['display'])
-                        selections_map[aid]['count'] += 1
-            else:
-                print(f"    [{model_info['display']}] No selections", flush=True)
-
-            time.sleep(15)  # Delay between models
-
-        time.sleep(30)  # Delay between batch groups
-
-    # Merging - only keep articles selected by at least 3 models
-    final_articles = []
-    print(f"\nMerging (3+ model consensus required)...", flush=True)
-    for aid, info in selections_map.items():
-        if len(info['models']) >= 2:
-            original = articles[aid].copy()
-            original['category'] = 'Priority'
-            original['reason'] = 'Systemic Significance'
-            original['selected_by'] = info['models']
-            final_articles.append(original)
+    # Results
+    print(f"\nRESULTS:", flush=True)
+    print(f"   Analyzed: {analyzed} headlines", flush=True)
+    print(f"   Selected: {len(final_articles)} unique articles", flush=True)
+    for filename in router.filenames:
+        print(f"   {router.label(filename)}: {router.counts[filename]} articles ({counts.get(filename, 0)} in feed)", flush=True)
 
-    print(f"   ✅ {len(final_articles)} articles passed 2+ model consensus from {len(selections_map)} total selections", flush=True)
+def require(artifact, path, command):
+    if artifact is None:
+        print(f"::error::{path} is missing or out of date; run `python main.py {command}` first", flush=True)
+        sys.exit(1)
+    print(f"Using {describe(path)}", flush=True)
+    return artifact
 
-    # Split by language
-    bangla_articles = []
-    english_articles = []
+def main(command="all"):
+    """Run one stage from the previous stage's artifact, or (default) the whole pipeline"""
+    print("=" * 60, flush=True)
+    print("Elite News Curator - Multi-API Ensemble", flush=True)
+    print("=" * 60, flush=True)
 
-    for article in final_articles:
-        if is_bangla(article['title']):
-            bangla_articles.append(article)
-        else:
-            english_articles.append(article)
+    if command == "fetch":
+        fetch_stage()
+        return
+    if command == "classify":
+        check_api_keys()
+        classify_stage(require(load_articles(), ARTICLES_FILE, "fetch"))
+        return
+    if command == "merge":
+        articles = require(load_articles(), ARTICLES_FILE, "fetch")
+        merge_stage(articles, require(load_vote_matrix(articles, CONSENSUS_MIN_VOTES), VOTES_FILE, "classify"))
+        return
+    if command == "render":
+        analyzed = len(load_articles() or [])
+        render_stage(require(load_selection(), SELECTION_FILE, "merge"), analyzed)
+        return
 
-    # Results
-    print(f"\nRESULTS:", flush=True)
-    print(f"   Analyzed: {len(articles)} headlines", flush=True)
-    print(f"   Selected: {len(final_articles)} unique articles", flush=True)
-    print(f"   Bangla: {len(bangla_articles)} articles", flush=True)
-    print(f"   English: {len(english_articles)} articles", flush=True)
+    check_api_keys()
+    articles = fetch_stage()
+    if not articles:
+        print("No articles found.", flush=True)
+        save_feeds([])
+        return
 
-    # Save Bangla to main feed, English to overflow
-    save_xml(bangla_articles, "filtered_feed.xml")
-    save_xml(english_articles, "filtered_feed_overflow.xml")
+    votes = classify_stage(articles)
+    final_articles = merge_stage(articles, votes)
+    render_stage(final_articles, len(articles))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Elite News Curator. Stages read and write their artifacts in " + ARTIFACT_DIR)
+    parser.add_argument("command", nargs="?", default="all", choices=["all", "fetch", "classify", "merge", "render"],
+                        help="run one stage (only classify calls the models) or, by default, all of them")
+    parser.add_argument("--min-votes", type=int, help=f"override CONSENSUS_MIN_VOTES ({CONSENSUS_MIN_VOTES})")
+    parser.add_argument("--profile", action="store_true", help="per-stage profile report (see profiling.py)")
+    args = parser.parse_args()
+    if args.min_votes:
+        CONSENSUS_MIN_VOTES = args.min_votes
+    if args.profile:
+        enable_profiling()
+    # A cancelled or timed-out Action sends SIGTERM; unwind so usage, metrics and stored votes are kept
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    try:
+        main(args.command)
+    finally:
+        if args.command in ("all", "classify"):
+            # Only these call the models; merge and render would overwrite the report with empty metrics
+            save_usage()
+            write_run_report()
+        write_profile_report()
@@ -0,0 +1,189 @@
+# metrics.py - per provider/model run metrics, written as a JSON report and a Prometheus textfile
+import os
+import json
+import math
+import time
+import threading
+from backoff import rate_limit_report
+from budget import usage_report
+
+# --- Configuration ---
+RUN_REPORT_FILE = "run_report.json"
+PROM_FILE = "metrics.prom"
+LATENCY_BUCKETS = [0.5, 1, 2, 5, 10, 20, 40, 90]
+PERCENTILES = [50, 90, 99]
+
+_lock = threading.Lock()
+_started = time.time()
+METRICS = {}
+NOTES = {}
+
+def _series(provider, model):
+    return METRICS.setdefault((provider, model), {
+        "latencies": [], "status": {}, "bytes_out": 0, "bytes_in": 0,
+        "json_errors": 0, "net_errors": 0, "limiter_wait_seconds": 0.0,
+        "batches": 0, "batch_items": 0, "selections": [],
+    })
+
+def _request_bytes(response):
+    request = getattr(response, "request", None)
+    body = getattr(request, "body", None)
+    if body is None:
+        body = getattr(request, "content", b"")   # httpx
+    return len(body or b"")
+
+def record_response(provider, model, response):
+    """One HTTP response: latency, status and bytes each way"""
+    elapsed = getattr(response, "elapsed", None)
+    with _lock:
+        s = _series(provider, model)
+        if elapsed is not None:
+            s["latencies"].append(elapsed.total_seconds())
+        status = str(response.status_code)
+        s["status"][status] = s["status"].get(status, 0) + 1
+        s["bytes_out"] += _request_bytes(response)
+        s["bytes_in"] += len(response.content or b"")
+
+def record_error(provider, model, kind):
+    """kind: json_errors or net_errors"""
+    with _lock:
+        _series(provider, model)[kind] += 1
+
+def record_wait(provider, model, seconds):
+    with _lock:
+        _series(provider, model)["limiter_wait_seconds"] += seconds
+
+def record_batch(provider, model, items, selected):
+    with _lock:
+        s = _series(provider, model)
+        s["batches"] += 1
+        s["batch_items"] += items
+        s["selections"].append(selected)
+
+def note(key, value):
+    """Attach run-level context (tiers, counts) to the report"""
+    with _lock:
+        NOTES[key] = value
+
+def wait_totals():
+    """Seconds spent so far on provider requests, limiter waits and backoff sleeps, summed over workers"""
+    with _lock:
+        provider = sum(sum(s["latencies"]) for s in METRICS.values())
+        limiter = sum(s["limiter_wait_seconds"] for s in METRICS.values())
+    backoff = sum(seen["sleep_seconds"] for seen in rate_limit_report().values())
+    return {"provider_seconds": provider, "limiter_seconds": limiter, "backoff_seconds": backoff}
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(p / 100 * len(ordered)))) - 1]
+
+def run_report():
+    sleeps = {name: seen["sleep_seconds"] for name, seen in rate_limit_report().items()}
+    models = []
+    with _lock:
+        for (provider, model), s in sorted(METRICS.items()):
+            latencies = s["latencies"]
+            status = s["status"]
+            models.append({
+                "provider": provider,
+                "model": model,
+                "requests": sum(status.values()),
+                "status": dict(status),
+                "http_429": status.get("429", 0),
+                "http_5xx": sum(n for code, n in status.items() if code.startswith("5")),
+                "json_errors": s["json_errors"],
+                "net_errors": s["net_errors"],
+                "latency_seconds": {f"p{p}": percentile(latencies, p) for p in PERCENTILES} |
+                                   {"max": max(latencies) if latencies else None, "sum": round(sum(latencies), 3)},
+                "bytes_out": s["bytes_out"],
+                "bytes_in": s["bytes_in"],
+                "backoff_sleep_seconds": round(sleeps.get(model, 0.0), 3),
+                "limiter_wait_seconds": round(s["limiter_wait_seconds"], 3),
+                "batches": s["batches"],
+                "batch_items": s["batch_items"],
+                "selections_per_batch": round(sum(s["selections"]) / len(s["selections"]), 2) if s["selections"] else None,
+            })
+        notes = dict(NOTES)
+    return {"started": _started, "wall_seconds": round(time.time() - _started, 3), "models": models,
+            "tokens": usage_report(), **notes}
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+def prometheus_text(report):
+    lines = [
+        "# HELP curator_run_duration_seconds Wall time of the curator run.",
+        "# TYPE curator_run_duration_seconds gauge",
+        f"curator_run_duration_seconds {report['wall_seconds']}",
+        "# HELP curator_request_duration_seconds Provider request latency.",
+        "# TYPE curator_request_duration_seconds histogram",
+    ]
+    counters = [
+        ("curator_requests_total", "HTTP responses by status."),
+        ("curator_bytes_sent_total", "Request body bytes."),
+        ("curator_bytes_received_total", "Response body bytes."),
+        ("curator_json_errors_total", "Replies without a parseable JSON id array."),
+        ("curator_network_errors_total", "Requests that failed below HTTP."),
+        ("curator_sleep_seconds_total", "Time spent waiting, by kind."),
+        ("curator_batches_total", "Batches answered."),
+        ("curator_batch_selections_total", "Articles selected across answered batches."),
+        ("curator_tokens_total", "Tokens billed, from the usage blocks of replies."),
+    ]
+    samples = {name: [] for name, _ in counters}
+    with _lock:
+        series = {key: (list(s["latencies"]), sum(s["selections"])) for key, s in METRICS.items()}
+    for m in report["models"]:
+        base = {"provider": m["provider"], "model": m["model"]}
+        latencies, selected = series.get((m["provider"], m["model"]), ([], 0))
+        for le in LATENCY_BUCKETS:
+            lines.append(f"curator_request_duration_seconds_bucket{_labels(**base, le=le)} {sum(1 for v in latencies if v <= le)}")
+        lines.append(f"curator_request_duration_seconds_bucket{_labels(**base, le='+Inf')} {len(latencies)}")
+        lines.append(f"curator_request_duration_seconds_sum{_labels(**base)} {round(sum(latencies), 3)}")
+        lines.append(f"curator_request_duration_seconds_count{_labels(**base)} {len(latencies)}")
+        for status, n in sorted(m["status"].items()):
+            samples["curator_requests_total"].append(f"{_labels(**base, status=status)} {n}")
+        samples["curator_bytes_sent_total"].append(f"{_labels(**base)} {m['bytes_out']}")
+        samples["curator_bytes_received_total"].append(f"{_labels(**base)} {m['bytes_in']}")
+        samples["curator_json_errors_total"].append(f"{_labels(**base)} {m['json_errors']}")
+        samples["curator_network_errors_total"].append(f"{_labels(**base)} {m['net_errors']}")
+        samples["curator_sleep_seconds_total"].append(f"{_labels(**base, kind='backoff')} {m['backoff_sleep_seconds']}")
+        samples["curator_sleep_seconds_total"].append(f"{_labels(**base, kind='limiter')} {m['limiter_wait_seconds']}")
+        samples["curator_batches_total"].append(f"{_labels(**base)} {m['batches']}")
+        samples["curator_batch_selections_total"].append(f"{_labels(**base)} {selected}")
+    for model, t in sorted(report.get("tokens", {}).items()):
+        for kind in ("prompt", "completion", "reasoning"):
+            samples["curator_tokens_total"].append(f"{_labels(model=model, kind=kind)} {t[kind]}")
+    for name, help_text in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [name + sample for sample in samples[name]]
+    return "\n".join(lines) + "\n"
+
+def _atomic_write(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def write_run_report():
+    """Write RUN_REPORT_FILE and PROM_FILE and print a one-line summary per model"""
+    report = run_report()
+    try:
+        _atomic_write(RUN_REPORT_FILE, json.dumps(report, indent=1, ensure_ascii=False, default=str))
+        _atomic_write(PROM_FILE, prometheus_text(report))
+    except OSError as e:
+        print(f"::warning::Could not write run metrics: {e}", flush=True)
+        return report
+    print(f"\nRun metrics ({report['wall_seconds']:.1f}s wall) -> {RUN_REPORT_FILE}, {PROM_FILE}", flush=True)
+    for m in report["models"]:
+        lat = m["latency_seconds"]
+        p50 = f"{lat['p50']:.2f}s" if lat["p50"] is not None else "-"
+        p90 = f"{lat['p90']:.2f}s" if lat["p90"] is not None else "-"
+        print(f"   [{m['provider']}/{m['model']}] {m['requests']} requests, p50 {p50}, p90 {p90}, "
+              f"{m['http_429']}x 429, {m['http_5xx']}x 5xx, {m['json_errors']} JSON errors, "
+              f"slept {m['backoff_sleep_seconds'] + m['limiter_wait_seconds']:.1f}s", flush=True)
+    return report
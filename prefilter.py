@@ -0,0 +1,129 @@
+# prefilter.py - offline noise filter run before any LLM call
+import re
+import math
+import zlib
+from collections import Counter
+from lxml import etree
+from store import open_store, prompt_key, vote_history
+
+# --- Configuration ---
+HISTORY_FILES = ["filtered_feed.xml", "filtered_feed_overflow.xml"]
+NOISE_PROBABILITY_CUTOFF = 0.98   # Classifier must be this sure before it drops anything
+MIN_TRAINING_TITLES = 30          # Per class; below this only the lexicon runs
+NEGATIVE_MIN_VOTES = 3            # A stored article counts as noise once this many models rejected it
+
+# STEP 1 "instant noise" of SYSTEM_PROMPT, in English and Bangla
+NOISE_PATTERNS = [
+    # sports
+    r"\b(cricket|football|t20|odi|world cup|fifa|olympics?|tournament|match|hat-?trick|goalkeeper)\b",
+    r"(ক্রিকেট|ফুটবল|বিশ্বকাপ|টি-?টোয়েন্টি|অলিম্পিক|টুর্নামেন্ট|ম্যাচ|গোলরক্ষক|ব্যাটসম্যান|বোলার)",
+    # entertainment and celebrity
+    r"\b(film|movie|cinema|actor|actress|celebrity|bollywood|hollywood|dhallywood|singer|album|box office)\b",
+    r"(চলচ্চিত্র|সিনেমা|অভিনেতা|অভিনেত্রী|নায়ক|নায়িকা|তারকা|গায়ক|গায়িকা|শুটিং)",
+    # lifestyle
+    r"\b(recipe|fashion|beauty tips|skincare|horoscope|travel diary)\b",
+    r"(রেসিপি|ফ্যাশন|রূপচর্চা|রাশিফল|ভ্রমণকাহিনি)",
+    # tribute and hagiography
+    r"\b(tribute|in memoriam|remembering|birth anniversary|death anniversary|obituary|homage)\b",
+    r"(জন্মবার্ষিকী|মৃত্যুবার্ষিকী|প্রয়াণ|স্মরণে|শ্রদ্ধাঞ্জলি|শ্রদ্ধার্ঘ্য|জন্মদিনে|অমর স্মৃতি)",
+]
+
+# A named substantive domain overrides a noise hit ("cricket diplomacy and trade" stays)
+SIGNAL_PATTERNS = [
+    r"\b(econom\w*|inflation|reserves?|remittances?|exports?|imports?|trade|bank\w*|imf|world bank|budget|tax\w*|"
+    r"war|conflict|sanctions?|un|nato|climate|flood|cyclone|health|governance|corruption|policy|energy|gas|power)\b",
+    r"(অর্থনীতি|অর্থনৈতিক|মূল্যস্ফীতি|রিজার্ভ|রেমিট্যান্স|রপ্তানি|আমদানি|বাণিজ্য|ব্যাংক|বাজেট|রাজস্ব|যুদ্ধ|সংঘাত|"
+    r"নিষেধাজ্ঞা|জাতিসংঘ|জলবায়ু|বন্যা|ঘূর্ণিঝড়|স্বাস্থ্য|দুর্নীতি|নীতি|জ্বালানি|বিদ্যুৎ)",
+]
+
+NOISE_RE = re.compile("|".join(NOISE_PATTERNS), re.IGNORECASE)
+SIGNAL_RE = re.compile("|".join(SIGNAL_PATTERNS), re.IGNORECASE)
+SOURCE_SUFFIX_RE = re.compile(r"\s*\.?\s*\[\s*[^\]]*\]\s*$")
+TOKEN_RE = re.compile(r"[a-z0-9ঀ-৿]+")
+
+def clean_title(title):
+    return SOURCE_SUFFIX_RE.sub("", title or "").strip()
+
+def tokenize(title):
+    return TOKEN_RE.findall(clean_title(title).lower())
+
+def lexicon_noise(title):
+    title = clean_title(title)
+    return bool(NOISE_RE.search(title)) and not SIGNAL_RE.search(title)
+
+def train(keep_titles, noise_titles):
+    """Multinomial naive Bayes over title words; None if there is too little history"""
+    if len(keep_titles) < MIN_TRAINING_TITLES or len(noise_titles) < MIN_TRAINING_TITLES:
+        return None
+    counts = {"keep": Counter(), "noise": Counter()}
+    for label, titles in (("keep", keep_titles), ("noise", noise_titles)):
+        for title in titles:
+            counts[label].update(tokenize(title))
+    vocab = set(counts["keep"]) | set(counts["noise"])
+    total = len(keep_titles) + len(noise_titles)
+    model = {"vocab": vocab}
+    for label, docs in (("keep", keep_titles), ("noise", noise_titles)):
+        denom = sum(counts[label].values()) + len(vocab)
+        model[label] = {
+            "prior": math.log(len(docs) / total),
+            "unseen": math.log(1 / denom),
+            "words": {w: math.log((c + 1) / denom) for w, c in counts[label].items()},
+        }
+    return model
+
+def noise_probability(model, title):
+    scores = {}
+    for label in ("keep", "noise"):
+        m = model[label]
+        scores[label] = m["prior"] + sum(m["words"].get(w, m["unseen"]) for w in tokenize(title) if w in model["vocab"])
+    top = max(scores.values())
+    keep, noise = (math.exp(scores[k] - top) for k in ("keep", "noise"))
+    return noise / (keep + noise)
+
+def load_history_titles(files=HISTORY_FILES):
+    """Titles the ensemble selected in earlier runs"""
+    titles = []
+    for path in files:
+        try:
+            for _, item in etree.iterparse(path, events=("end",), tag="item"):
+                title = item.findtext("title") or ""
+                if item.findtext("link"):
+                    titles.append(title)
+                item.clear()
+        except (OSError, etree.XMLSyntaxError):
+            continue
+    return titles
+
+def is_noise(model, title):
+    if lexicon_noise(title):
+        return True
+    return model is not None and noise_probability(model, title) >= NOISE_PROBABILITY_CUTOFF
+
+def prefilter_articles(articles, system_prompt, history_files=HISTORY_FILES):
+    """Drop high-confidence noise locally; returns the articles to send to the models.
+    Only votes cast under `system_prompt` train the classifier: the screener's and
+    other scripts' prompts judge by different criteria."""
+    keep_titles = load_history_titles(history_files)
+    noise_titles = []
+    try:
+        for title, yes, total in vote_history(open_store(), prompt_key(system_prompt)):
+            if yes == 0 and total >= NEGATIVE_MIN_VOTES:
+                noise_titles.append(title)
+            elif yes >= 2:
+                keep_titles.append(title)
+    except Exception as e:
+        print(f"::warning::Pre-filter could not read vote history: {e}", flush=True)
+
+    # Hold out every fifth known-good title to estimate how often we would wrongly drop one
+    held_out = [t for t in keep_titles if zlib.crc32(t.encode("utf-8")) % 5 == 0]
+    training = [t for t in keep_titles if zlib.crc32(t.encode("utf-8")) % 5 != 0]
+    model = train(training, noise_titles)
+
+    kept = [a for a in articles if not is_noise(model, a['title'])]
+    false_rejects = sum(1 for t in held_out if is_noise(model, t))
+    rate = false_rejects / len(held_out) if held_out else 0.0
+
+    print(f"Pre-filter: dropped {len(articles) - len(kept)}/{len(articles)} as noise "
+          f"({'lexicon + classifier' if model else 'lexicon only'}; "
+          f"est. false-reject rate {rate:.1%} on {len(held_out)} held-out selections)", flush=True)
+    return kept
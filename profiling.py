@@ -0,0 +1,105 @@
+# profiling.py - opt-in per-stage cProfile + tracemalloc report (CURATOR_PROFILE=1 or --profile)
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from feeds import FETCH_STATS
+from metrics import wait_totals
+
+# --- Configuration ---
+PROFILE_ENABLED = os.environ.get("CURATOR_PROFILE", "") not in ("", "0")
+PROFILE_REPORT_FILE = "profile_report.json"
+PROFILE_DIR = "profiles"        # One <stage>.prof per stage, for snakeviz / python -m pstats
+PROFILE_TOP_FUNCTIONS = 15
+TRACEMALLOC_FRAMES = 1
+
+STAGES = {}      # name -> totals; a stage entered twice (bmain's cluster step) accumulates
+_profiles = {}   # name -> pstats.Stats
+_depth = 0
+
+def enable_profiling():
+    global PROFILE_ENABLED
+    PROFILE_ENABLED = True
+
+def _waits():
+    waits = wait_totals()
+    waits["fetch_seconds"] = FETCH_STATS["seconds"]
+    return waits
+
+def _top_functions(stats, limit=PROFILE_TOP_FUNCTIONS):
+    rows = []
+    for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({func})", "calls": ncalls,
+                     "self_seconds": round(tottime, 4), "cumulative_seconds": round(cumtime, 4)})
+    rows.sort(key=lambda r: r["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+@contextmanager
+def stage(name):
+    """Profile one pipeline stage; a no-op unless profiling is enabled.
+
+    cProfile sees the calling thread only (worker threads show up as waits on
+    their futures); CPU time, allocations and the wait counters cover the process."""
+    global _depth
+    if not PROFILE_ENABLED or _depth:
+        yield
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    mem_start = tracemalloc.get_traced_memory()[0]
+    waits_start = _waits()
+    profiler = cProfile.Profile()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    _depth += 1
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _depth -= 1
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        mem_end, mem_peak = tracemalloc.get_traced_memory()
+        waits = {k: round(v - waits_start[k], 3) for k, v in _waits().items()}
+        if name in _profiles:
+            _profiles[name].add(profiler)
+        else:
+            _profiles[name] = pstats.Stats(profiler, stream=io.StringIO())
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            _profiles[name].dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+        except OSError as e:
+            print(f"::warning::Could not save {name} profile: {e}", flush=True)
+        totals = STAGES.setdefault(name, {"stage": name, "calls": 0, "peak_alloc_bytes": 0, "net_alloc_bytes": 0})
+        totals["calls"] += 1
+        for key, value in (("wall_seconds", wall), ("cpu_seconds", cpu),
+                           ("fetch_wait_seconds", waits["fetch_seconds"]),
+                           ("provider_wait_seconds", waits["provider_seconds"]),
+                           ("backoff_sleep_seconds", waits["backoff_seconds"]),
+                           ("limiter_wait_seconds", waits["limiter_seconds"])):
+            totals[key] = round(totals.get(key, 0.0) + value, 3)
+        totals["peak_alloc_bytes"] = max(totals["peak_alloc_bytes"], mem_peak - mem_start)
+        totals["net_alloc_bytes"] += mem_end - mem_start
+        totals["top_functions"] = _top_functions(_profiles[name])
+
+def write_profile_report():
+    """Write PROFILE_REPORT_FILE and print a per-stage breakdown; no-op when nothing was profiled"""
+    if not STAGES:
+        return None
+    report = {"stages": list(STAGES.values()), "note": "Wait columns are summed over worker threads and can exceed wall time."}
+    try:
+        with open(PROFILE_REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    except OSError as e:
+        print(f"::warning::Could not write profile report: {e}", flush=True)
+    print(f"\nStage profile -> {PROFILE_REPORT_FILE}, {PROFILE_DIR}/", flush=True)
+    for s in STAGES.values():
+        print(f"   [{s['stage']}] {s['wall_seconds']:.2f}s wall, {s['cpu_seconds']:.2f}s CPU, "
+              f"waits: fetch {s['fetch_wait_seconds']:.1f}s, provider {s['provider_wait_seconds']:.1f}s, "
+              f"backoff {s['backoff_sleep_seconds']:.1f}s, limiter {s['limiter_wait_seconds']:.1f}s; "
+              f"peak +{s['peak_alloc_bytes'] / 1e6:.1f} MB", flush=True)
+    return report
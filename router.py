@@ -0,0 +1,86 @@
+# router.py - script detection and one-pass routing of articles to the output feeds
+import os
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+from cluster import SOURCE_SUFFIX_RE
+
+# --- Configuration ---
+# Each article goes to the first route whose conditions all match; a route without
+# conditions catches everything left. Conditions: "script" (detected by majority),
+# "sources" (link host or the "[ source ]" title suffix) and "categories".
+FEED_ROUTES = [
+    {"file": "filtered_feed.xml", "title": "Elite News Feed (Bangla)", "label": "Bangla", "script": "bengali"},
+    {"file": "filtered_feed_overflow.xml", "title": "Elite News Feed (English)", "label": "English"},
+]
+
+SCRIPT_CLASSES = {
+    "bengali": "\u0980-\u09FF",
+    "devanagari": "\u0900-\u097F",
+    "arabic": "\u0600-\u06FF",
+    "latin": "A-Za-z\u00C0-\u024F",
+}
+SCRIPT_RE = re.compile("|".join(f"(?P<{name}>[{chars}]+)" for name, chars in SCRIPT_CLASSES.items()))
+SOURCE_RE = re.compile(r"\[\s*([^\]]+?)\s*\]\s*$")
+
+def script_counts(text):
+    """Letters per script in one regex pass; runs of a script are matched whole"""
+    counts = Counter()
+    for m in SCRIPT_RE.finditer(text or ""):
+        counts[m.lastgroup] += m.end() - m.start()
+    return counts
+
+def detect_script(text):
+    """Majority script of a title, ignoring the trailing "[ source ]" tag; None without letters"""
+    counts = script_counts(SOURCE_SUFFIX_RE.sub("", text or ""))
+    return counts.most_common(1)[0][0] if counts else None
+
+def article_source(art):
+    m = SOURCE_RE.search(art.get('title') or "")
+    if m:
+        return m.group(1).lower()
+    host = urlsplit(art.get('link') or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+def route_matches(route, art, script):
+    if "script" in route and route["script"] != script:
+        return False
+    if "sources" in route:
+        source, host = article_source(art), (urlsplit(art.get('link') or "").hostname or "")
+        if not any(s in source or s in host for s in route["sources"]):
+            return False
+    if "categories" in route and art.get('category') not in route["categories"]:
+        return False
+    return True
+
+def route_title(filename, routes=FEED_ROUTES):
+    """Channel title for a feed or one of its archive pages"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    for route in routes:
+        route_stem = os.path.splitext(os.path.basename(route["file"]))[0]
+        if stem == route_stem or stem.startswith(route_stem + "-"):
+            return route.get("title", "Elite News Feed")
+    return "Elite News Feed"
+
+class FeedRouter:
+    """Callable route(article) -> feed file for write_feeds; counts articles per feed"""
+    def __init__(self, routes=FEED_ROUTES):
+        self.routes = routes
+        self.filenames = [r["file"] for r in routes]
+        self.counts = Counter()
+
+    def __call__(self, art):
+        script = detect_script(art.get('title'))
+        for route in self.routes:
+            if route_matches(route, art, script):
+                self.counts[route["file"]] += 1
+                return route["file"]
+        # No catch-all configured: fall back to the last feed rather than lose the item
+        self.counts[self.routes[-1]["file"]] += 1
+        return self.routes[-1]["file"]
+
+    def label(self, filename):
+        for route in self.routes:
+            if route["file"] == filename:
+                return route.get("label", filename)
+        return filename
@@ -0,0 +1,306 @@
+# rss.py - streaming RSS writer shared by main.py, m.py and bmain.py
+import os
+import gzip
+import json
+import hashlib
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from lxml import etree
+from feeds import canonical_link, parse_pub_date
+from describe import DescriptionRenderer, legacy_description, related_html, safe_url
+from router import FEED_ROUTES, route_title
+
+# --- Configuration ---
+FEED_LINK = "https://github.com/evilgodfahim"
+FEED_DESCRIPTION = "AI-curated structural news feed"
+
+# Paged output: the subscription feed keeps only CURRENT_PAGE_DAYS of items and links
+# (RFC 5005 prev-archive) to immutable day pages under ARCHIVE_DIR; every output also
+# gets a JSON Feed and a precompressed .gz copy for GitHub Pages.
+FEED_BASE_URL = "https://evilgodfahim.github.io/gist/"
+ARCHIVE_DIR = "archive"
+CURRENT_PAGE_DAYS = 2
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+HISTORY_NS = "http://purl.org/syndication/history/1.0"
+
+def rss_now():
+    return datetime.now().strftime("%a, %d %b %Y %H:%M:%S +0600")
+
+def feed_title(filename):
+    return route_title(filename)
+
+def text_element(tag, children, **attrib):
+    """One small <item>-style element; children are (tag, text) or (tag, text, attrib)"""
+    el = etree.Element(tag, **attrib)
+    for child in children:
+        sub = etree.SubElement(el, child[0], **(child[2] if len(child) > 2 else {}))
+        sub.text = child[1]
+    return el
+
+def item_element(art, renderer=None):
+    """renderer is a describe.DescriptionRenderer; without one the full legacy description is kept"""
+    html_desc = renderer.render(art) if renderer is not None else legacy_description(art, related_html(art))
+    children = [("title", art['title']), ("link", art['link']), ("pubDate", art['pubDate'])]
+    if art.get('thread_id'):
+        children.append(("category", art['thread_id'], {"domain": "thread"}))
+    children.append(("description", html_desc))
+    return text_element("item", children)
+
+def notice_element(title, description):
+    return text_element("item", [("title", title), ("description", description), ("pubDate", rss_now())])
+
+class FeedWriter:
+    """Context manager that writes one RSS file item by item into a temp file and
+    renames it into place on a clean exit; the temp file is discarded on error.
+    `links` are (rel, href) Atom links for the channel header; `archive` marks an
+    RFC 5005 archive document."""
+    def __init__(self, filename, links=(), archive=False):
+        self.filename = filename
+        self.tmp = f"{filename}.tmp"
+        self.count = 0
+        self.links = links
+        self.archive = archive
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        self.stack = ExitStack()
+        f = self.stack.enter_context(open(self.tmp, "wb"))
+        self.xf = self.stack.enter_context(etree.xmlfile(f, encoding="utf-8"))
+        self.xf.write_declaration()
+        # Unwound in reverse: closing whitespace is written before each end tag
+        nsmap = {"atom": ATOM_NS, "fh": HISTORY_NS} if self.links or self.archive else None
+        self.stack.enter_context(self.xf.element("rss", version="2.0", nsmap=nsmap))
+        self.stack.callback(self.xf.write, "\n")
+        self.xf.write("\n  ")
+        self.stack.enter_context(self.xf.element("channel"))
+        self.stack.callback(self.xf.write, "\n  ")
+        for tag, text in (("title", feed_title(self.filename)), ("lastBuildDate", rss_now()),
+                          ("link", FEED_LINK), ("description", FEED_DESCRIPTION)):
+            el = etree.Element(tag)
+            el.text = text
+            self.xf.write("\n    ")
+            self.xf.write(el)
+        for rel, href in self.links:
+            self.xf.write("\n    ")
+            with self.xf.element(f"{{{ATOM_NS}}}link", rel=rel, href=href):
+                pass
+        if self.archive:
+            self.xf.write("\n    ")
+            with self.xf.element(f"{{{HISTORY_NS}}}archive"):
+                pass
+        return self
+
+    def write(self, element):
+        etree.indent(element, space="  ", level=2)
+        self.xf.write("\n    ")
+        self.xf.write(element)
+        self.xf.flush()
+
+    def add(self, item):
+        self.write(item)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.stack.__exit__(exc_type, exc, tb)
+        finally:
+            if exc_type is None:
+                os.replace(self.tmp, self.filename)
+            elif os.path.exists(self.tmp):
+                os.remove(self.tmp)
+        return False
+
+def load_items(filename):
+    """<item>s already published in a feed, without the End of Feed / System Error notices"""
+    items = []
+    try:
+        for _, el in etree.iterparse(filename, tag="item"):
+            if el.findtext("link"):
+                # Rebuilt detached so no namespace declarations ride along from the channel
+                items.append(text_element("item", [(c.tag, c.text, dict(c.attrib)) for c in el if isinstance(c.tag, str)]))
+            el.clear()
+    except (OSError, etree.XMLSyntaxError):
+        return []
+    return items
+
+def item_time(item):
+    return parse_pub_date(item.findtext("pubDate")) or datetime.min.replace(tzinfo=timezone.utc)
+
+def merge_items(new_items, old_items):
+    """Merge by link (the new rendering wins), newest pubDate first"""
+    fresh = {canonical_link(el.findtext("link")) for el in new_items}
+    merged = new_items + [el for el in old_items if canonical_link(el.findtext("link")) not in fresh]
+    merged.sort(key=item_time, reverse=True)
+    return merged
+
+def items_digest(items):
+    h = hashlib.sha256()
+    for el in items:
+        etree.indent(el, space="  ", level=2)
+        h.update(etree.tostring(el, encoding="utf-8"))
+    return h.hexdigest()
+
+def feed_url(path):
+    return FEED_BASE_URL + path.replace(os.sep, "/")
+
+def archive_path(filename, day):
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(os.path.dirname(filename), ARCHIVE_DIR, f"{stem}-{day}.xml")
+
+def archive_days(filename):
+    """Days that already have an archive page for this feed, oldest first"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    directory = os.path.join(os.path.dirname(filename), ARCHIVE_DIR)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    days = []
+    for name in names:
+        day = name[len(stem) + 1:-len(".xml")]
+        if name.startswith(stem + "-") and name.endswith(".xml") and len(day) == 10 and day[:4].isdigit():
+            days.append(day)
+    return sorted(days)
+
+def write_json_feed(filename, items):
+    """JSON Feed 1.1 twin of an RSS feed, for index.html and light clients"""
+    path = os.path.splitext(filename)[0] + ".json"
+    entries = []
+    for el in items:
+        link = el.findtext("link")
+        entry = {"id": link, "title": el.findtext("title"), "content_html": el.findtext("description") or ""}
+        url = safe_url(link)
+        if url and not url.lower().startswith("mailto:"):
+            # index.html turns url into a clickable link; javascript: and friends stay out
+            entry["url"] = url
+        published = parse_pub_date(el.findtext("pubDate"))
+        if published:
+            entry["date_published"] = published.isoformat()
+        thread = el.find("category[@domain='thread']")
+        if thread is not None:
+            entry["tags"] = [f"thread:{thread.text}"]
+        entries.append(entry)
+    feed = {"version": "https://jsonfeed.org/version/1.1", "title": feed_title(filename),
+            "home_page_url": FEED_LINK, "feed_url": feed_url(path), "items": entries}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(feed, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+def precompress(path):
+    """Write path.gz next to path; mtime is zeroed so identical input gives identical bytes"""
+    tmp = f"{path}.gz.tmp"
+    with open(path, "rb") as src, open(tmp, "wb") as raw:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=9, mtime=0) as gz:
+            gz.write(src.read())
+    os.replace(tmp, f"{path}.gz")
+
+def archive_items(filename, items):
+    """Fold items that left the subscription feed into their day's archive page"""
+    by_day = {}
+    for el in items:
+        by_day.setdefault(item_time(el).date().isoformat(), []).append(el)
+    written = 0
+    for day, day_items in sorted(by_day.items()):
+        path = archive_path(filename, day)
+        old_items = load_items(path)
+        merged = merge_items(day_items, old_items)
+        if items_digest(merged) == items_digest(old_items):
+            continue
+        earlier = [d for d in archive_days(filename) if d < day]
+        links = [("current", feed_url(filename))]
+        if earlier:
+            links.append(("prev-archive", feed_url(archive_path(filename, earlier[-1]))))
+        with FeedWriter(path, links=links, archive=True) as writer:
+            for item in merged:
+                writer.add(item)
+        precompress(path)
+        written += 1
+    return written
+
+def update_feeds(articles, route, filenames, window, error_message=None, paged=False):
+    """Rolling-window variant of write_feeds; feeds whose items are unchanged are not
+    rewritten. With paged=True only CURRENT_PAGE_DAYS stay in the feed and the rest
+    move to day archive pages."""
+    routed = {filename: [] for filename in filenames}
+    renderers = {filename: DescriptionRenderer() for filename in filenames}
+    for art in articles:
+        filename = route(art)
+        routed[filename].append(item_element(art, renderers[filename]))
+    for filename in filenames:
+        if routed[filename]:
+            print(renderers[filename].summary(filename), flush=True)
+    counts = {}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=CURRENT_PAGE_DAYS)
+    for filename in filenames:
+        old_items = load_items(filename)
+        merged = merge_items(routed[filename], old_items)
+        links = []
+        if paged:
+            items = [el for el in merged if item_time(el) >= cutoff][:window]
+            current = {id(el) for el in items}
+            archived = archive_items(filename, [el for el in merged if id(el) not in current])
+            days = archive_days(filename)
+            links = [("self", feed_url(filename))]
+            if days:
+                links.append(("prev-archive", feed_url(archive_path(filename, days[-1]))))
+            if archived:
+                print(f"   Archived items into {archived} day pages for {filename}", flush=True)
+        else:
+            items = merged[:window]
+        counts[filename] = len(items)
+        json_missing = paged and not os.path.exists(os.path.splitext(filename)[0] + ".json")
+        if not error_message and not json_missing and items_digest(items) == items_digest(old_items):
+            print(f"   {filename} unchanged ({len(items)} items), not rewritten", flush=True)
+            continue
+        try:
+            with FeedWriter(filename, links=links) as writer:
+                if error_message:
+                    writer.write(notice_element("System Error", f"Script failed: {error_message}"))
+                for item in items:
+                    writer.add(item)
+                if not items and not error_message:
+                    writer.write(notice_element("End of Feed", "No additional articles in this feed."))
+            if paged:
+                precompress(filename)
+                precompress(write_json_feed(filename, items))
+            print(f"   Saved {writer.count} items to {filename} "
+                  f"({len(routed[filename])} new, window of {window})", flush=True)
+        except Exception as e:
+            print(f"::error::Failed to write XML {filename}: {e}", flush=True)
+    return counts
+
+def write_feeds(articles, route, filenames=None, error_message=None, window=None, paged=False):
+    """Stream articles into several feeds in one pass; route(article) names the file.
+
+    Feeds that receive no items get the "End of Feed" notice, and every feed gets the
+    "System Error" item when error_message is set. With window=N the feeds are
+    updated incrementally instead, optionally paged (see update_feeds).
+    Returns {filename: items in feed}."""
+    filenames = filenames or [r["file"] for r in FEED_ROUTES]
+    if window:
+        return update_feeds(articles, route, filenames, window, error_message, paged)
+    writers = [FeedWriter(filename) for filename in filenames]
+    try:
+        with ExitStack() as stack:
+            by_name = {w.filename: stack.enter_context(w) for w in writers}
+            renderers = {w.filename: DescriptionRenderer() for w in writers}
+            if error_message:
+                for writer in writers:
+                    writer.write(notice_element("System Error", f"Script failed: {error_message}"))
+            else:
+                for art in articles:
+                    filename = route(art)
+                    by_name[filename].add(item_element(art, renderers[filename]))
+                for writer in writers:
+                    if not writer.count:
+                        writer.write(notice_element("End of Feed", "No additional articles in this feed."))
+        for writer in writers:
+            print(f"   Saved {writer.count} items to {writer.filename}", flush=True)
+            if writer.count:
+                print(renderers[writer.filename].summary(writer.filename), flush=True)
+    except Exception as e:
+        print(f"::error::Failed to write XML feeds: {e}", flush=True)
+    return {writer.filename: writer.count for writer in writers}
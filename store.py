@@ -0,0 +1,79 @@
+# store.py - persistent per-model vote store shared by main.py, m.py and bmain.py
+import os
+import time
+import sqlite3
+import hashlib
+from feeds import CACHE_DIR, canonical_link
+
+# --- Configuration ---
+STORE_FILE = os.path.join(CACHE_DIR, "articles.db")
+STORE_MAX_AGE_DAYS = 14
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    link TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    link TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    selected INTEGER NOT NULL,
+    classified_at REAL NOT NULL,
+    PRIMARY KEY (link, model, prompt)
+);
+"""
+
+def prompt_key(prompt):
+    """Votes are only reusable under the exact prompt that produced them"""
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+
+def open_store(path=STORE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(SCHEMA)
+    cutoff = time.time() - STORE_MAX_AGE_DAYS * 86400
+    conn.execute("DELETE FROM votes WHERE classified_at < ?", (cutoff,))
+    conn.execute("DELETE FROM articles WHERE first_seen < ?", (cutoff,))
+    conn.commit()
+    return conn
+
+def load_votes(conn, articles, prompt):
+    """Return {article id: {model name: selected}} for every stored verdict"""
+    ids_by_link = {}
+    for a in articles:
+        ids_by_link.setdefault(canonical_link(a['link']), []).append(a['id'])
+
+    votes = {}
+    links = list(ids_by_link)
+    for i in range(0, len(links), 500):
+        chunk = links[i:i + 500]
+        rows = conn.execute(
+            f"SELECT link, model, selected FROM votes WHERE prompt = ? AND link IN ({','.join('?' * len(chunk))})",
+            [prompt, *chunk]
+        )
+        for link, model, selected in rows:
+            for aid in ids_by_link[link]:
+                votes.setdefault(aid, {})[model] = bool(selected)
+    return votes
+
+def record_votes(conn, model_name, prompt, batch, decisions):
+    """Persist one model's keep/reject verdict for every article it was shown"""
+    now = time.time()
+    chosen = {d for d in decisions if isinstance(d, int)}
+    rows = [(canonical_link(a['link']), model_name, prompt, int(a['id'] in chosen), now) for a in batch]
+    conn.executemany("INSERT OR REPLACE INTO votes VALUES (?, ?, ?, ?, ?)", rows)
+    conn.executemany(
+        "INSERT OR IGNORE INTO articles VALUES (?, ?, ?)",
+        [(canonical_link(a['link']), a['title'], now) for a in batch]
+    )
+    conn.commit()
+
+def vote_history(conn, prompt):
+    """(title, yes votes, total votes) for every article stored under one prompt_key"""
+    return conn.execute(
+        "SELECT a.title, SUM(v.selected), COUNT(*) FROM articles a JOIN votes v ON v.link = a.link "
+        "WHERE v.prompt = ? GROUP BY a.link",
+        (prompt,)
+    ).fetchall()
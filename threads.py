@@ -0,0 +1,129 @@
+# threads.py - cross-day story threads: a small persistent MinHash index of past selections
+import os
+import json
+import time
+import base64
+import struct
+from datetime import datetime
+from feeds import CACHE_DIR, canonical_link
+from cluster import NUM_PERM, BANDS, shingles, signature
+
+# --- Configuration ---
+THREADS_FILE = os.path.join(CACHE_DIR, "threads.json")
+THREAD_SIMILARITY = 0.5        # Estimated title Jaccard needed to join an existing thread
+THREAD_MAX_AGE_DAYS = 14       # Threads quiet for longer than this are forgotten
+THREAD_MAX_ENTRIES = 600         # 14 days of picks at ~40 a day; older entries drop first
+THREAD_PRIOR_LINKS = 5         # Earlier coverage links shown per item
+
+SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+
+def title_signature(title):
+    """MinHash signature cut to the low 32 bits of each value, as it is stored"""
+    return tuple(v & 0xFFFFFFFF for v in signature(shingles(title)))
+
+def pack_signature(sig):
+    """~350 bytes of base64 per article"""
+    return base64.b64encode(struct.pack(SIGNATURE_FORMAT, *sig)).decode("ascii")
+
+def unpack_signature(text):
+    return struct.unpack(SIGNATURE_FORMAT, base64.b64decode(text))
+
+def band_keys(sig):
+    rows = NUM_PERM // BANDS
+    return [(band, sig[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+def estimated_similarity(a, b):
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+def _index_entry(index, entry):
+    pos = len(index["entries"])
+    index["entries"].append(entry)
+    index["links"][canonical_link(entry["link"])] = pos
+    index["threads"].setdefault(entry["thread"], []).append(pos)
+    for key in band_keys(entry["sig"]):
+        index["buckets"].setdefault(key, []).append(pos)
+
+def load_threads(path=THREADS_FILE):
+    """Load the thread index and rebuild its in-memory LSH buckets"""
+    index = {"entries": [], "links": {}, "buckets": {}, "threads": {}, "next_id": 0, "loaded_at": time.time()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return index
+    index["next_id"] = data.get("next_id", 0)
+    cutoff = index["loaded_at"] - THREAD_MAX_AGE_DAYS * 86400
+    last_seen = {}
+    for thread_id, _, _, _, seen in data.get("entries", []):
+        last_seen[thread_id] = max(seen, last_seen.get(thread_id, 0))
+    for thread_id, link, title, packed, seen in data.get("entries", [])[-THREAD_MAX_ENTRIES:]:
+        if last_seen[thread_id] < cutoff:
+            continue
+        _index_entry(index, {"thread": thread_id, "link": link, "title": title,
+                             "sig": unpack_signature(packed), "seen": seen})
+    return index
+
+def save_threads(index, path=THREADS_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = {
+        "next_id": index["next_id"],
+        "entries": [[e["thread"], e["link"], e["title"], pack_signature(e["sig"]), e["seen"]]
+                    for e in index["entries"][-THREAD_MAX_ENTRIES:]],
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def _new_thread_id(index):
+    thread_id = f"{datetime.now():%Y%m%d}-{index['next_id']}"
+    index["next_id"] += 1
+    return thread_id
+
+def find_thread(index, sig):
+    """Best matching thread among entries sharing an LSH band, or None"""
+    best, best_sim = None, THREAD_SIMILARITY
+    candidates = {pos for key in band_keys(sig) for pos in index["buckets"].get(key, ())}
+    for pos in candidates:
+        sim = estimated_similarity(sig, index["entries"][pos]["sig"])
+        if sim >= best_sim:
+            best, best_sim = index["entries"][pos]["thread"], sim
+    return best
+
+def prior_coverage(index, thread_id, exclude_links=()):
+    """Links from earlier runs in this thread, newest first"""
+    seen_links = set(exclude_links)
+    prior = []
+    for pos in reversed(index["threads"].get(thread_id, [])):
+        e = index["entries"][pos]
+        link = canonical_link(e["link"])
+        if e["seen"] >= index["loaded_at"] or link in seen_links:
+            continue
+        seen_links.add(link)
+        prior.append({"title": e["title"], "link": e["link"], "seen": e["seen"]})
+        if len(prior) >= THREAD_PRIOR_LINKS:
+            break
+    return prior
+
+def assign_thread(index, articles):
+    """Put one story (its articles) on a thread, add it to the index and return
+    (thread id, earlier coverage). An already indexed link keeps its thread."""
+    links = [canonical_link(a['link']) for a in articles]
+    sigs = [title_signature(a['title']) for a in articles]
+    thread_id = None
+    for link in links:
+        if link in index["links"]:
+            thread_id = index["entries"][index["links"][link]]["thread"]
+            break
+    for sig in sigs:
+        if thread_id is not None:
+            break
+        thread_id = find_thread(index, sig)
+    if thread_id is None:
+        thread_id = _new_thread_id(index)
+
+    now = time.time()
+    for a, link, sig in zip(articles, links, sigs):
+        if link not in index["links"]:
+            _index_entry(index, {"thread": thread_id, "link": a['link'], "title": a['title'], "sig": sig, "seen": now})
+    return thread_id, prior_coverage(index, thread_id, links)
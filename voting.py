@@ -0,0 +1,103 @@
+# voting.py - consensus voting over MODELS with early exit and an optional screening tier
+import time
+from store import open_store, prompt_key, load_votes, record_votes
+from cache import cached_votes, remember_votes
+from dispatch import dispatch, estimate_tokens, pack_batches
+from metrics import record_batch
+from budget import plan_units
+
+def is_open(article_votes, models, min_votes):
+    """True while an article can still go either way with the models not yet asked.
+    A failed call is recorded as None: it is neither a vote nor still available."""
+    yes = sum(1 for v in article_votes.values() if v)
+    unasked = sum(1 for m in models if m['name'] not in article_votes)
+    return yes < min_votes and yes + unasked >= min_votes
+
+def vote_waves(models, wave_size=None):
+    """Split MODELS (in order) into waves that are queried one after another"""
+    wave_size = wave_size or len(models)
+    return [models[i:i + wave_size] for i in range(0, len(models), wave_size)]
+
+def collect_votes(articles, models, system_prompt, call, min_votes, wave_size=None, max_batches=20, stats=None):
+    """Return {article id: {model name: True/False/None}}.
+
+    Models run wave by wave; within a wave they are dispatched in parallel. Before
+    each wave, articles that already have min_votes, or can no longer reach it,
+    are dropped so later models see smaller batches. Stored and cached verdicts
+    count as votes without a network call. `stats`, if given, accumulates calls and
+    estimated tokens."""
+    store = open_store()
+    prompt = prompt_key(system_prompt)
+    votes = load_votes(store, articles, prompt)
+    print(f"Stored votes reused for {len(votes)} articles", flush=True)
+
+    estimate = lambda model_info, batch: estimate_tokens(model_info, system_prompt, batch)
+    waves = vote_waves(models, wave_size)
+
+    for wave_idx, wave in enumerate(waves):
+        units = []
+        for model_info in wave:
+            name = model_info['name']
+            candidates = [a for a in articles
+                          if name not in votes.get(a['id'], {}) and is_open(votes.get(a['id'], {}), models, min_votes)]
+            for aid, selected in cached_votes(name, system_prompt, candidates).items():
+                votes.setdefault(aid, {})[name] = selected
+            pending = [a for a in candidates if name not in votes.get(a['id'], {})]
+            batches = pack_batches(model_info, system_prompt, pending)[:max_batches]
+            units += [(model_info, batch) for batch in batches]
+            print(f"  [{model_info['display']}] {len(pending)} articles packed into {len(batches)} batches", flush=True)
+
+        units = plan_units(units, estimate)
+        if stats is not None:
+            stats["calls"] += len(units)
+            stats["tokens"] += sum(estimate(m, b) for m, b in units)
+
+        print(f"\nWave {wave_idx + 1}/{len(waves)}: dispatching {len(units)} calls across {len(wave)} models...", flush=True)
+        for model_info, batch, decisions in dispatch(units, call, estimate):
+            name = model_info['name']
+            if decisions is None:
+                print(f"    [{model_info['display']}] No selections (call failed)", flush=True)
+                for a in batch:
+                    votes.setdefault(a['id'], {})[name] = None
+                continue
+
+            record_votes(store, name, prompt, batch, decisions)
+            remember_votes(name, system_prompt, batch, decisions)
+            chosen = {d for d in decisions if isinstance(d, int)}
+            for a in batch:
+                votes.setdefault(a['id'], {})[name] = a['id'] in chosen
+            record_batch(model_info.get("api", "groq"), name, len(batch), sum(1 for a in batch if a['id'] in chosen))
+            print(f"    [{model_info['display']}] Selected {sum(1 for a in batch if a['id'] in chosen)} articles", flush=True)
+
+    return votes
+
+def tally(votes, models):
+    """Turn a vote matrix into the {aid: {'models': [display...], 'count': n}} selections map"""
+    selections_map = {}
+    for aid, article_votes in votes.items():
+        chosen_by = [m['display'] for m in models if article_votes.get(m['name'])]
+        if chosen_by:
+            selections_map[aid] = {'models': chosen_by, 'count': len(chosen_by)}
+    return selections_map
+
+def screen_articles(articles, screener, screen_prompt, call, stats=None, max_batches=20):
+    """Tier 1 of the cascade: keep everything the screener did not explicitly reject.
+    Articles whose screening call failed are passed through."""
+    screen_call = lambda model_info, batch: call(model_info, batch, screen_prompt)
+    votes = collect_votes(articles, [screener], screen_prompt, screen_call, 1, max_batches=max_batches, stats=stats)
+    return [a for a in articles if votes.get(a['id'], {}).get(screener['name']) is not False]
+
+def new_tier(name, articles):
+    return {"name": name, "articles_in": len(articles), "articles_out": 0,
+            "calls": 0, "tokens": 0, "started": time.monotonic()}
+
+def finish_tier(tier, survivors):
+    tier["articles_out"] = len(survivors)
+    tier["seconds"] = time.monotonic() - tier.pop("started")
+    return tier
+
+def print_tier_summary(tiers):
+    print("\nTier summary:", flush=True)
+    for t in tiers:
+        print(f"   [{t['name']}] {t['articles_in']} in -> {t['articles_out']} out, "
+              f"{t['calls']} calls, ~{t['tokens']} tokens (est.), {t['seconds']:.1f}s", flush=True)